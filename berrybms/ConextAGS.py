@@ -11,11 +11,20 @@
 from pymodbus.client.mixin import ModbusClientMixin # type: ignore
 from ModbusDevice import ModbusDevice
 from Register import Register
+from RegisterTable import RegisterTable
 from enum import Enum
 import time
 
 class ConextAGS(ModbusDevice):
 
+    REGISTERS = RegisterTable([
+        Register("GeneratorMode", 0x004D, ModbusClientMixin.DATATYPE.UINT16),
+        Register("GeneratorAutoStartOnBatterySOC", 0x0055, ModbusClientMixin.DATATYPE.UINT16, refresh=Register.SLOW),
+        Register("GeneratorAutoStopOnBatterySOC", 0x0056, ModbusClientMixin.DATATYPE.UINT16, refresh=Register.SLOW),
+        Register("SOCLevelStopGenerator", 0x0087, ModbusClientMixin.DATATYPE.UINT16, refresh=Register.SLOW),
+        Register("SOCLevelStartGenerator", 0x0088, ModbusClientMixin.DATATYPE.UINT16, refresh=Register.SLOW)
+    ])
+
     GeneratorModeOff = 0
     GeneratorModeOn = 1
     GeneratorModeAutomatic = 2
@@ -29,13 +38,7 @@ class ConextAGS(ModbusDevice):
         self.connection = connection
 
         if self.connection != None:
-            self.registers = [
-                Register(self, "GeneratorMode", 0x004D, ModbusClientMixin.DATATYPE.UINT16),
-                Register(self, "GeneratorAutoStartOnBatterySOC", 0x0055, ModbusClientMixin.DATATYPE.UINT16),
-                Register(self, "GeneratorAutoStopOnBatterySOC", 0x0056, ModbusClientMixin.DATATYPE.UINT16),
-                Register(self, "SOCLevelStopGenerator", 0x0087, ModbusClientMixin.DATATYPE.UINT16),
-                Register(self, "SOCLevelStartGenerator", 0x0088, ModbusClientMixin.DATATYPE.UINT16)
-            ]
+            self.setRegisters(ConextAGS.REGISTERS)
 
     def disconnect(self):
         pass
@@ -47,10 +50,10 @@ class ConextAGS(ModbusDevice):
     def setGeneratorMode(self, mode):
         register = self.getRegister("GeneratorMode")
 
-        v = register.getValue(self.connection, True)
+        v = register.getValue(self, True)
 
         if (v != mode):
-            register.setValue(self.connection, mode)
+            register.setValue(self, mode)
 
     def publish(self, c):
        pass
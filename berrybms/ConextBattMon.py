@@ -14,9 +14,23 @@ import json
 
 from ModbusDevice import ModbusDevice
 from Register import Register
+from RegisterTable import RegisterTable
 
 class ConextBattMon(ModbusDevice):
 
+    REGISTERS = RegisterTable([
+        Register("BatteryVoltage", 0x0046, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("BatteryCapacity", 0x0092, ModbusClientMixin.DATATYPE.UINT16, refresh=Register.SLOW),
+        Register("BatteryCapacityRemaining", 0x0058, ModbusClientMixin.DATATYPE.UINT32),
+        Register("BatteryCapacityRemoved", 0x005A, ModbusClientMixin.DATATYPE.UINT32),
+        Register("BatteryCurrent", 0x0048, ModbusClientMixin.DATATYPE.INT32, 0.001),
+        Register("BatteryMidpoint1Voltage", 0x0052, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("BatteryMidpoint2Voltage", 0x0054, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("BatteryMidpoint3Voltage", 0x0056, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("BatterySOC", 0x004C, ModbusClientMixin.DATATYPE.UINT32),
+        #Register("BatteryStateOfHealth", 0x004E, DataType.UINT32)       # useless, returns 0
+    ])
+
     def __init__(self,
                 id,
                 serial_number=None,
@@ -25,18 +39,7 @@ class ConextBattMon(ModbusDevice):
         self.connection = connection
 
         if self.connection != None:
-            self.registers = [
-                Register(self, "BatteryVoltage", 0x0046, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "BatteryCapacity", 0x0092, ModbusClientMixin.DATATYPE.UINT16),
-                Register(self, "BatteryCapacityRemaining", 0x0058, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "BatteryCapacityRemoved", 0x005A, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "BatteryCurrent", 0x0048, ModbusClientMixin.DATATYPE.INT32, 0.001),
-                Register(self, "BatteryMidpoint1Voltage", 0x0052, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "BatteryMidpoint2Voltage", 0x0054, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "BatteryMidpoint3Voltage", 0x0056, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "BatterySOC", 0x004C, ModbusClientMixin.DATATYPE.UINT32),
-                #Register(self, "BatteryStateOfHealth", 0x004E, DataType.UINT32)       # useless, returns 0
-            ]
+            self.setRegisters(ConextBattMon.REGISTERS)
 
     def disconnect(self):
         pass
@@ -10,8 +10,13 @@
 #
 import pymodbus.client as ModbusClient # type: ignore
 from pymodbus.client.mixin import ModbusClientMixin # type: ignore
+import asyncio
+import json
+import threading
 
 from ModbusDevice import ModbusDevice
+from ModbusPacer import ModbusPacer
+from ModbusTcpPipeline import ModbusTcpPipeline
 from ConextAGS import ConextAGS
 from ConextBattMon import ConextBattMon
 from ConextMPPT import ConextMPPT
@@ -21,6 +26,10 @@ from Register import Register
 
 class ConextInsightHome(ModbusDevice):
 
+    # Registers probed on each unit id during discovery
+    FGANumber = Register("FGANumber", 0x000A, ModbusClientMixin.DATATYPE.STRING, None, 10)
+    HardwareSerialNumber = Register("HardwareSerialNumber", 0x002B, ModbusClientMixin.DATATYPE.STRING, None, 10)
+
     # See Modbus Map: Conext ModbusConverter/ComBox Device documentation
     # for Product ID <> Description mapping on all Conext products
     ConextProductMap = {
@@ -37,44 +46,183 @@ class ConextInsightHome(ModbusDevice):
                  host=None,
                  port=None,
                  ids=None,
-                 serial_number_hack=None):
+                 serial_number_hack=None,
+                 inter_frame_gap=0,
+                 pipeline=None,
+                 discovery_cache=None,
+                 probe_timeout=1,
+                 discovery_window=16):
         super().__init__(id)
         self.host = host
         self.port = port
+        self.inter_frame_gap = inter_frame_gap
         self.ids = ids
         self.serial_number_hack = serial_number_hack
         self.devices = []
+
+        # When set, the number of requests kept in flight by pollAll()
+        self.pipeline_window = pipeline
+        self.pipeline = None
+        self.loop = None
+
+        # Discovery probes all unit ids at once and remembers what it found
+        # in the discovery_cache file, if set
+        self.discovery_cache = discovery_cache
+        self.probe_timeout = probe_timeout
+        self.discovery_window = discovery_window
+        # Handed over by the verification thread, under verified_lock
+        self.verified = None
+        self.verified_lock = threading.Lock()
     
     def connect(self):
         if self.connection == None:
             self.connection = ModbusClient.ModbusTcpClient(self.host, port=self.port, timeout=10)
             if self.connection.connect():
                 print("Connected over modbus/TCP!")
+                # No silent interval is required over TCP, but some gateways
+                # appreciate a small delay between requests
+                self.connection.pacer = ModbusPacer(self.inter_frame_gap)
             else:
                 print("Cannot connect to modbus/TCP")
                 self.connection = None
 
         return self.connection
 
+    def disconnect(self):
+        if self.pipeline != None:
+            self.loop.run_until_complete(self.pipeline.close())
+            self.loop.close()
+            self.pipeline = None
+            self.loop = None
+        super().disconnect()
+
+    # Fetch the registers of all discovered devices at once, keeping several
+    # requests in flight over a dedicated asyncio connection. Values end up in
+    # each device's values dict, exactly as if dump() had fetched them. Return
+    # False if pipelining is disabled or if we can't connect, in which case
+    # devices will fetch their values themselves, one request at a time.
+    def pollAll(self):
+        if self.pipeline_window == None:
+            return False
+
+        if self.loop == None:
+            self.loop = asyncio.new_event_loop()
+            self.pipeline = ModbusTcpPipeline(self.host, self.port, self.pipeline_window)
+
+        return self.loop.run_until_complete(self.pollAllAsync())
+
+    async def pollAllAsync(self):
+        if not await self.pipeline.connect():
+            print("Cannot connect to modbus/TCP for pipelined requests")
+            return False
+
+        polls = []
+        for device in self.devices:
+            if device.registers == None:
+                continue
+            pending = device.dueRegisters()
+            polls.append(device.planner.readAsync(self.pipeline, device, pending))
+
+        await asyncio.gather(*polls)
+        return True
+
     def allDevices(self):
+        # A newer discovery result was found while verifying our cache
+        # in the background, we switch to it
+        with self.verified_lock:
+            (discovered, self.verified) = (self.verified, None)
+        if discovered != None:
+            self.devices = self.devicesFrom(discovered)
+
+        # What is connected to the InsightHome doesn't change while we are
+        # connected to it, so we only probe devices once
+        if len(self.devices) > 0:
+            return self.devices
+
         if self.ids == None:
             self.ids = range(1,247)
 
-        for i in self.ids:
+        # We trust what we discovered last time, but verify it in the background
+        discovered = self.loadDiscoveryCache()
+        if discovered != None:
+            self.devices = self.devicesFrom(discovered)
+            threading.Thread(target=self.verifyDiscoveryCache, args=(discovered,), daemon=True).start()
+            return self.devices
+
+        discovered = asyncio.run(self.discoverAsync(self.ids))
+        if discovered == None:
+            discovered = self.discoverSequentially(self.ids)
+        self.saveDiscoveryCache(discovered)
+
+        self.devices = self.devicesFrom(discovered)
+        return self.devices
+
+    def devicesFrom(self, discovered):
+        devices = []
+        for i in sorted(discovered.keys()):
+            clazz = ConextInsightHome.ConextProductMap[discovered[i]['fga']]
+            devices.append(clazz(i, discovered[i]['serial'], self.connection))
+        return devices
+
+    # Probe all unit ids concurrently, over a dedicated connection and with a
+    # short timeout. Return a unit id -> {fga, serial, class} dict or None if we
+    # can't connect.
+    async def discoverAsync(self, ids):
+        pipeline = ModbusTcpPipeline(self.host, self.port, self.discovery_window, self.probe_timeout)
+        if not await pipeline.connect():
+            return None
+
+        results = await asyncio.gather(*[self.probeAsync(pipeline, i) for i in ids])
+        await pipeline.close()
+
+        discovered = dict()
+        for result in results:
+            if result != None:
+                discovered[result[0]] = result[1]
+        return discovered
+
+    async def probeAsync(self, pipeline, i):
+        # We don't use the DeviceName as it can be changed in the InsightHome/Combox
+        (registers, exception_code) = await pipeline.readHoldingRegisters(i, ConextInsightHome.FGANumber.address, ConextInsightHome.FGANumber.length)
+        if registers == None:
+            return None
+
+        fga = str(ModbusClientMixin.convert_from_registers(registers, ModbusClientMixin.DATATYPE.STRING))
+        clazz = ConextInsightHome.ConextProductMap.get(fga, None)
+        if clazz == None:
+            print(f"Unknown Conext device {fga}")
+            return None
+
+        if self.serial_number_hack != None and self.serial_number_hack.get(i, None) != None:
+            serial_number = self.serial_number_hack[i]
+        else:
+            (registers, exception_code) = await pipeline.readHoldingRegisters(i, ConextInsightHome.HardwareSerialNumber.address, ConextInsightHome.HardwareSerialNumber.length)
+            if registers == None:
+                print(f"No hardware serial number for id {i} of type {clazz}")
+                return None
+            serial_number = str(ModbusClientMixin.convert_from_registers(registers, ModbusClientMixin.DATATYPE.STRING))
+
+        return (i, {'fga': fga, 'serial': serial_number, 'class': clazz.__name__})
+
+    def discoverSequentially(self, ids):
+        discovered = dict()
+
+        for i in ids:
             device = ModbusDevice(i)
+            device.connection = self.connection
             # We don't use the DeviceName as it can be changed in the InsightHome/Combox
-            reg = Register(device, "FGANumber", 0x000A, ModbusClientMixin.DATATYPE.STRING, None, 10)
-            value = reg.getValue(self.connection)
+            value = ConextInsightHome.FGANumber.getValue(device)
 
             if value == None:
                 #print("No device for id %d", i)
                 continue
 
             # We got something!
-            clazz = ConextInsightHome.ConextProductMap.get(str(value), None)
+            fga = str(value)
+            clazz = ConextInsightHome.ConextProductMap.get(fga, None)
 
             if clazz == None:
-                print(f"Unknown Conext device {str(value)}")
+                print(f"Unknown Conext device {fga}")
                 continue
 
             # All is good, let's fetch the serial number that we will use as the
@@ -84,16 +232,58 @@ class ConextInsightHome(ModbusDevice):
             if self.serial_number_hack != None and self.serial_number_hack.get(i, None) != None:
                 value = self.serial_number_hack[i]
             else:
-                reg = Register(device, "HardwareSerialNumber", 0x002B, ModbusClientMixin.DATATYPE.STRING, None, 10)
-                value = reg.getValue(self.connection)
+                value = ConextInsightHome.HardwareSerialNumber.getValue(device)
 
                 if value == None:
                     print(f"No hardware serial number for id {i} of type {clazz}")
                     continue
 
-            self.devices.append(clazz(i, value, self.connection))
+            discovered[i] = {'fga': fga, 'serial': value, 'class': clazz.__name__}
 
-        return self.devices
-    
+        return discovered
+
+    def loadDiscoveryCache(self):
+        if self.discovery_cache == None:
+            return None
+
+        try:
+            with open(self.discovery_cache, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        discovered = dict()
+        for key in cache.keys():
+            if cache[key].get('fga', None) not in ConextInsightHome.ConextProductMap:
+                return None
+            discovered[int(key)] = cache[key]
+
+        return discovered
+
+    def saveDiscoveryCache(self, discovered):
+        if self.discovery_cache == None or len(discovered) == 0:
+            return
+
+        try:
+            with open(self.discovery_cache, "w") as f:
+                json.dump(discovered, f, indent=2)
+        except OSError as e:
+            print(f"Cannot save Conext discovery cache: {e}")
+
+    # Run from a background thread. We probe the unit ids found in our cache
+    # and, only if any of them changed, all unit ids again. We then rewrite the
+    # cache and let allDevices() switch to the new devices. Finding nothing at
+    # all (ie, when every probe timed out) isn't trusted, we keep our cache then.
+    def verifyDiscoveryCache(self, cached):
+        discovered = asyncio.run(self.discoverAsync(sorted(cached.keys())))
+        if discovered == None or discovered == cached:
+            return
 
+        discovered = asyncio.run(self.discoverAsync(self.ids))
+        if not discovered or discovered == cached:
+            return
 
+        print("Conext devices changed since our last discovery, updating them.")
+        self.saveDiscoveryCache(discovered)
+        with self.verified_lock:
+            self.verified = discovered
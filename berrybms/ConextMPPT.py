@@ -14,9 +14,31 @@ import json
 
 from ModbusDevice import ModbusDevice
 from Register import Register
+from RegisterTable import RegisterTable
 
 class ConextMPPT(ModbusDevice):
 
+    REGISTERS = RegisterTable([
+        Register("PVVoltage", 0x004C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("PVCurrent", 0x004E, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("PVPower", 0x0050, ModbusClientMixin.DATATYPE.UINT32),
+        Register("DCOutputVoltage", 0x0058, ModbusClientMixin.DATATYPE.INT32, 0.001),
+        Register("DCOutputCurrent", 0x005A, ModbusClientMixin.DATATYPE.INT32, 0.001),
+        Register("DCOutputPower", 0x005C, ModbusClientMixin.DATATYPE.UINT32),
+        Register("EnergyFromPVThisHour", 0x0070, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyFromPVToday", 0x0074, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("PVInputActiveToday", 0x0076, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("EnergyFromPVThisWeek", 0x0078, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyFromPVThisMonth", 0x007C, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyFromPVThisYear", 0x0080, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyToBatteryThisHour", 0x0088, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyToBatteryToday", 0x008C, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyToBatteryThisWeek", 0x0090, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyToBatteryThisMonth", 0x0094, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyToBatteryThisYear", 0x0098, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("EnergyToBatteryLifetime", 0x009c, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+    ])
+
     def __init__(self,
                 id,
                 serial_number=None,
@@ -25,26 +47,7 @@ class ConextMPPT(ModbusDevice):
         self.connection = connection
 
         if self.connection != None:
-            self.registers = [
-                Register(self, "PVVoltage", 0x004C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "PVCurrent", 0x004E, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "PVPower", 0x0050, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "DCOutputVoltage", 0x0058, ModbusClientMixin.DATATYPE.INT32, 0.001),
-                Register(self, "DCOutputCurrent", 0x005A, ModbusClientMixin.DATATYPE.INT32, 0.001),
-                Register(self, "DCOutputPower", 0x005C, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "EnergyFromPVThisHour", 0x0070, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyFromPVToday", 0x0074, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "PVInputActiveToday", 0x0076, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "EnergyFromPVThisWeek", 0x0078, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyFromPVThisMonth", 0x007C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyFromPVThisYear", 0x0080, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyToBatteryThisHour", 0x0088, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyToBatteryToday", 0x008C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyToBatteryThisWeek", 0x0090, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyToBatteryThisMonth", 0x0094, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyToBatteryThisYear", 0x0098, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "EnergyToBatteryLifetime", 0x009c, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-            ]
+            self.setRegisters(ConextMPPT.REGISTERS)
 
     def disconnect(self):
         pass
@@ -14,9 +14,49 @@ import json
 
 from ModbusDevice import ModbusDevice
 from Register import Register
+from RegisterTable import RegisterTable
 
 class ConextXW(ModbusDevice):
 
+    REGISTERS = RegisterTable([
+        Register("EnergyFromBatteryThisHour", 0x00D0, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW), # looks like what goes INTO the battery from AC1/AC2
+        Register("EnergyFromBatteryToday", 0x00D4, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),    # looks like what goes INTO the battery from AC1/AC2
+        Register("BatteryDischargeActiveToday", 0x00D6, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("EnergyFromBatteryThisWeek", 0x00D8, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW), # looks like what goes INTO the battery from AC1/AC2
+        Register("EnergyFromBatteryThisMonth", 0x00DC, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),# looks like what goes INTO the battery from AC1/AC2 
+        Register("EnergyToBatteryThisHour", 0x00E8, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),   # looks like what we PULL from the battery
+        Register("EnergyToBatteryToday", 0x00EC, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),      # looks like what we PULL from the battery
+        Register("BatteryChargeActiveToday", 0x00EE, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("EnergyToBatteryThisWeek", 0x00F0, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),   # looks like what we PULL from the battery
+        Register("EnergyToBatteryThisMonth", 0x00F4, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),  # looks like what we PULL from the battery
+        Register("LoadOutputEnergyThisHour", 0x0130, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("LoadOutputEnergyToday", 0x0134, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("LoadOutputEnergyThisWeek", 0x0138, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("LoadOutputEnergyThisMonth", 0x013C, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("BatteryVoltage", 0x0050, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("BatteryCurrent", 0x0052, ModbusClientMixin.DATATYPE.INT32, 0.001),
+        Register("ChargeDCCurrent", 0x005C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
+        Register("ChargeDCPower", 0x005E, ModbusClientMixin.DATATYPE.UINT32),
+        #Register("ChargeDCPowerPercentage", 0x0060, ModbusClientMixin.DATATYPE.UINT16),
+        Register("GridACInputPower", 0x006C, ModbusClientMixin.DATATYPE.UINT32),
+        #Register("GridOutputPowerW", 0x0084, ModbusClientMixin.DATATYPE.UINT32),
+        #Register("GridOutputPowerVA", 0x008A, ModbusClientMixin.DATATYPE.UINT32),
+        #Register("GeneratorACPower", 0x00AC, ModbusClientMixin.DATATYPE.UINT32),
+        Register("GeneratorACPowerApparent", 0x00BA, ModbusClientMixin.DATATYPE.UINT32),
+        #Register("LoadACPowerW", 0x009A, ModbusClientMixin.DATATYPE.UINT32),                     # equals to LoadACPowerApparent
+        Register("LoadACPowerApparent", 0x00A0, ModbusClientMixin.DATATYPE.UINT32),
+        Register("GridInputEnergyThisHour", 0x0100, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GridInputEnergyToday", 0x0104, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GridInputActiveToday", 0x0106, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("GridInputEnergyThisWeek", 0x0108, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GridInputEnergyThisMonth", 0x010C, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GeneratorInputEnergyThisHour", 0x0148, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GeneratorInputEnergyToday", 0x014C, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GeneratorInputActiveToday", 0x014E, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("GeneratorInputEnergyThisWeek", 0x0150, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("GeneratorInputEnergyThisMonth", 0x0154, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+    ])
+
     def __init__(self,
                 id,
                 serial_number=None,
@@ -25,44 +65,7 @@ class ConextXW(ModbusDevice):
         self.connection = connection
 
         if self.connection != None:
-            self.registers = [
-                Register(self, "EnergyFromBatteryThisHour", 0x00D0, ModbusClientMixin.DATATYPE.UINT32, 0.001), # looks like what goes INTO the battery from AC1/AC2
-                Register(self, "EnergyFromBatteryToday", 0x00D4, ModbusClientMixin.DATATYPE.UINT32, 0.001),    # looks like what goes INTO the battery from AC1/AC2
-                Register(self, "BatteryDischargeActiveToday", 0x00D6, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "EnergyFromBatteryThisWeek", 0x00D8, ModbusClientMixin.DATATYPE.UINT32, 0.001), # looks like what goes INTO the battery from AC1/AC2
-                Register(self, "EnergyFromBatteryThisMonth", 0x00DC, ModbusClientMixin.DATATYPE.UINT32, 0.001),# looks like what goes INTO the battery from AC1/AC2 
-                Register(self, "EnergyToBatteryThisHour", 0x00E8, ModbusClientMixin.DATATYPE.UINT32, 0.001),   # looks like what we PULL from the battery
-                Register(self, "EnergyToBatteryToday", 0x00EC, ModbusClientMixin.DATATYPE.UINT32, 0.001),      # looks like what we PULL from the battery
-                Register(self, "BatteryChargeActiveToday", 0x00EE, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "EnergyToBatteryThisWeek", 0x00F0, ModbusClientMixin.DATATYPE.UINT32, 0.001),   # looks like what we PULL from the battery
-                Register(self, "EnergyToBatteryThisMonth", 0x00F4, ModbusClientMixin.DATATYPE.UINT32, 0.001),  # looks like what we PULL from the battery
-                Register(self, "LoadOutputEnergyThisHour", 0x0130, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "LoadOutputEnergyToday", 0x0134, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "LoadOutputEnergyThisWeek", 0x0138, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "LoadOutputEnergyThisMonth", 0x013C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "BatteryVoltage", 0x0050, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "BatteryCurrent", 0x0052, ModbusClientMixin.DATATYPE.INT32, 0.001),
-                Register(self, "ChargeDCCurrent", 0x005C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "ChargeDCPower", 0x005E, ModbusClientMixin.DATATYPE.UINT32),
-                #Register(self, "ChargeDCPowerPercentage", 0x0060, ModbusClientMixin.DATATYPE.UINT16),
-                Register(self, "GridACInputPower", 0x006C, ModbusClientMixin.DATATYPE.UINT32),
-                #Register(self, "GridOutputPowerW", 0x0084, ModbusClientMixin.DATATYPE.UINT32),
-                #Register(self, "GridOutputPowerVA", 0x008A, ModbusClientMixin.DATATYPE.UINT32),
-                #Register(self, "GeneratorACPower", 0x00AC, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "GeneratorACPowerApparent", 0x00BA, ModbusClientMixin.DATATYPE.UINT32),
-                #Register(self, "LoadACPowerW", 0x009A, ModbusClientMixin.DATATYPE.UINT32),                     # equals to LoadACPowerApparent
-                Register(self, "LoadACPowerApparent", 0x00A0, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "GridInputEnergyThisHour", 0x0100, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GridInputEnergyToday", 0x0104, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GridInputActiveToday", 0x0106, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "GridInputEnergyThisWeek", 0x0108, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GridInputEnergyThisMonth", 0x010C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GeneratorInputEnergyThisHour", 0x0148, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GeneratorInputEnergyToday", 0x014C, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GeneratorInputActiveToday", 0x014E, ModbusClientMixin.DATATYPE.UINT32),
-                Register(self, "GeneratorInputEnergyThisWeek", 0x0150, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                Register(self, "GeneratorInputEnergyThisMonth", 0x0154, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-            ]
+            self.setRegisters(ConextXW.REGISTERS)
 
     def disconnect(self):
         pass
@@ -0,0 +1,93 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import time
+
+# Reduce device updates to what changed since they were last published. A
+# numeric value is only considered changed once it moved by at least the
+# deadband of its field, fields being matched on the longest pattern their
+# name contains (ie, "CellVol" for CellVol0, CellVol1, ...). Every keyframe
+# seconds, all values of a device are published again so that late
+# subscribers catch up.
+class DeltaFilter(object):
+
+    KEYFRAME = 300
+
+    def __init__(self,
+                 deadbands=None,
+                 keyframe=None):
+        self.deadbands = dict() if deadbands == None else deadbands
+        self.keyframe = DeltaFilter.KEYFRAME if keyframe == None else keyframe
+        self.published = dict()
+        self.keyframe_at = dict()
+        # Deadband of each field name, resolved from the patterns once
+        self.fields = dict()
+
+    @staticmethod
+    def fromConfig(config):
+        if config == None:
+            return None
+        return DeltaFilter(config.get('deadbands', None), config.get('keyframe', None))
+
+    def deadband(self, field):
+        deadband = self.fields.get(field, None)
+        if deadband == None:
+            deadband = 0
+            pattern = ""
+            for (candidate, value) in self.deadbands.items():
+                if candidate in field and len(candidate) > len(pattern):
+                    pattern = candidate
+                    deadband = value
+            self.fields[field] = deadband
+        return deadband
+
+    def changed(self, field, previous, value):
+        if previous == None or value == None:
+            return previous != value
+
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(previous, (int, float)):
+            return previous != value
+
+        deadband = self.deadband(field)
+        if deadband == 0:
+            return previous != value
+        return abs(value - previous) >= deadband
+
+    # Return the values of a device which need to be published, remembering
+    # them as published
+    def filter(self, key, values, now=None):
+        if now == None:
+            now = time.monotonic()
+
+        published = self.published.get(key, None)
+        if published == None or now >= self.keyframe_at.get(key, 0):
+            self.published[key] = dict(values)
+            self.keyframe_at[key] = now + self.keyframe
+            return dict(values)
+
+        delta = {}
+        for (field, value) in values.items():
+            if field not in published or self.changed(field, published[field], value):
+                delta[field] = value
+                published[field] = value
+
+        return delta
+
+    # Same as filter() for a dict of devices, devices without changes being left out
+    def filterAll(self, all_devices, now=None):
+        if now == None:
+            now = time.monotonic()
+
+        filtered = {}
+        for (key, values) in all_devices.items():
+            delta = self.filter(key, values, now)
+            if len(delta) > 0:
+                filtered[key] = delta
+        return filtered
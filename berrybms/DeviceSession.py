@@ -0,0 +1,177 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import concurrent.futures
+import time
+
+from ConextInsightHome import ConextInsightHome
+from JKBMS import JKBMS
+from MqttPublisher import MqttPublisher
+
+# Long-lived connections to the MQTT broker, the BMS and the InsightHome. The
+# same device objects (and their register tables) are reused from one update
+# to the next, connections are health checked before each update and
+# reestablished with an exponential backoff when they fail.
+class DeviceSession(object):
+
+    MIN_BACKOFF = 5
+    MAX_BACKOFF = 300
+
+    def __init__(self,
+                 config):
+        self.config = config
+        self.publisher = None
+        self.all_jkbms = dict()
+        self.conext = None
+        self.executor = None
+        self.in_flight = dict()
+        self.backoff = dict()
+        self.retry_at = dict()
+
+    def canRetry(self, key):
+        return time.monotonic() >= self.retry_at.get(key, 0)
+
+    def failed(self, key):
+        backoff = min(self.backoff.get(key, DeviceSession.MIN_BACKOFF/2)*2, DeviceSession.MAX_BACKOFF)
+        self.backoff[key] = backoff
+        self.retry_at[key] = time.monotonic() + backoff
+
+    def succeeded(self, key):
+        self.backoff.pop(key, None)
+        self.retry_at.pop(key, None)
+
+    # Return our MQTT publisher, shared with the sniffers. It connects (and
+    # reconnects) to the broker in the background.
+    def mqtt(self):
+        if self.publisher == None:
+            self.publisher = MqttPublisher(self.config)
+            self.publisher.start()
+        return self.publisher
+
+    # Return a connected BMS, reconnecting it if it became unhealthy
+    def bms(self, key, bms):
+        jkbms = self.all_jkbms.get(key, None)
+        if jkbms == None:
+            jkbms = JKBMS(key, bms['id'], bms['port'], bms.get('protocol', 'registers'))
+            self.all_jkbms[key] = jkbms
+
+        if jkbms.connection != None and jkbms.isHealthy():
+            return jkbms
+
+        if not self.canRetry(key):
+            return None
+
+        if jkbms.connection == None:
+            c = jkbms.connect()
+        else:
+            print(f"Reconnecting to BMS {key}...")
+            c = jkbms.reconnect()
+
+        if c == None:
+            self.failed(key)
+            return None
+
+        self.succeeded(key)
+        return jkbms
+
+    # Return a connected InsightHome with all its devices discovered
+    def insightHome(self):
+        if self.conext == None:
+            self.conext = ConextInsightHome(self.config['conext']['insighthome']['host'],
+                                            self.config['conext']['insighthome']['port'],
+                                            self.config['conext']['insighthome'].get('ids', None),
+                                            self.config['conext'].get('serial_number_hack', None),
+                                            self.config['conext']['insighthome'].get('inter_frame_gap', 0),
+                                            self.config['conext']['insighthome'].get('pipeline', None),
+                                            self.config['conext']['insighthome'].get('discovery_cache', None),
+                                            self.config['conext']['insighthome'].get('probe_timeout', 1),
+                                            self.config['conext']['insighthome'].get('discovery_window', 16))
+
+        if self.conext.connection != None and self.conext.isHealthy():
+            return self.conext
+
+        if not self.canRetry('insighthome'):
+            return None
+
+        if self.conext.connection == None:
+            c = self.conext.connect()
+        else:
+            print("Reconnecting to the InsightHome...")
+            c = self.conext.reconnect()
+
+        if c == None:
+            self.failed('insighthome')
+            return None
+
+        self.succeeded('insighthome')
+        self.conext.allDevices()
+        return self.conext
+
+    # Fetch all values of a BMS. This is run from a worker thread when
+    # polling BMS concurrently.
+    def pollBMS(self, jkbms):
+        return (jkbms, jkbms.formattedOutput())
+
+    # Poll all BMS, one after the other or, when enabled, each from its own
+    # worker so that the cycle lasts as long as the slowest BMS. BMS not done
+    # before the deadline are skipped for this cycle, and until their worker
+    # is done.
+    def pollAllBMS(self, all_bms, polling):
+        all_jkbms = dict()
+        for key in all_bms.keys():
+            future = self.in_flight.get(key, None)
+            if future != None and not future.done():
+                print(f"BMS {key} is still busy with the previous update, skipping it.")
+                continue
+
+            jkbms = self.bms(key, all_bms[key])
+            if jkbms != None:
+                all_jkbms[key] = jkbms
+
+        if not polling.get('concurrent', False) or len(all_jkbms) < 2:
+            return [self.pollBMS(all_jkbms[key]) for key in all_jkbms.keys()]
+
+        if self.executor == None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(all_bms))
+
+        for key in all_jkbms.keys():
+            self.in_flight[key] = self.executor.submit(self.pollBMS, all_jkbms[key])
+
+        futures = [self.in_flight[key] for key in all_jkbms.keys()]
+        (done, not_done) = concurrent.futures.wait(futures, timeout=polling.get('deadline', 30))
+
+        results = []
+        for key in all_jkbms.keys():
+            future = self.in_flight[key]
+            if future in not_done:
+                print(f"BMS {key} did not answer in time, skipping it.")
+            elif future.exception() != None:
+                print(f"Error while polling BMS {key}: {future.exception()}")
+            else:
+                results.append(future.result())
+
+        return results
+
+    def close(self):
+        if self.executor != None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+        if self.publisher != None:
+            self.publisher.stop()
+            self.publisher = None
+
+        for jkbms in self.all_jkbms.values():
+            jkbms.disconnect()
+        self.all_jkbms = dict()
+
+        if self.conext != None:
+            self.conext.disconnect()
+            self.conext = None
@@ -0,0 +1,96 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+
+# Fixed-capacity receive buffer for fixed-length frames starting with a known
+# header, such as the JK BMS ones. Bytes are appended to a preallocated
+# bytearray and frames are returned as memoryviews over it, without copying.
+# Those views are only valid until the next append(), which may move the
+# unread bytes back to the start of the buffer.
+class FrameBuffer(object):
+
+    def __init__(self,
+                 header,
+                 length,
+                 is_valid=None,
+                 capacity=4096):
+        self.header = bytes(header)
+        self.length = length
+        self.is_valid = is_valid
+        self.buffer = bytearray(max(capacity, 2*length))
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        # Bytes we had to throw away, either because the buffer was full or
+        # because they didn't belong to a valid frame
+        self.discarded = 0
+        self.invalid = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def append(self, data):
+        size = len(data)
+        if size == 0:
+            return
+
+        if size > len(self.buffer):
+            self.discarded += size - len(self.buffer)
+            data = memoryview(data)[size-len(self.buffer):]
+            size = len(self.buffer)
+
+        # Not enough room left at the end, we move what's unread back to the
+        # start of the buffer. If it's still not enough, we drop the oldest bytes.
+        if self.end + size > len(self.buffer):
+            pending = self.end - self.start
+            drop = max(0, pending + size - len(self.buffer))
+            self.discarded += drop
+            self.buffer[0:pending-drop] = self.view[self.start+drop:self.end]
+            self.start = 0
+            self.end = pending-drop
+
+        self.view[self.end:self.end+size] = data
+        self.end += size
+
+    # Return all complete and valid frames (as memoryviews) found in the
+    # buffer, consuming them along with anything found before them
+    def frames(self):
+        frames = []
+
+        while True:
+            i = self.buffer.find(self.header, self.start, self.end)
+            if i < 0:
+                # We keep what could be the start of a header
+                start = max(self.start, self.end - len(self.header) + 1)
+                self.discarded += start - self.start
+                self.start = start
+                break
+
+            self.discarded += i - self.start
+            self.start = i
+            if i + self.length > self.end:
+                break
+
+            frame = self.view[i:i+self.length]
+            if self.is_valid != None and not self.is_valid(frame):
+                # Maybe a header lookalike, we resume the search right after it
+                self.invalid += 1
+                self.discarded += 1
+                self.start = i + 1
+                continue
+
+            frames.append(frame)
+            self.start = i + self.length
+
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+
+        return frames
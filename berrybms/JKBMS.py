@@ -11,44 +11,89 @@
 import pymodbus.client as ModbusClient # type: ignore
 from pymodbus.client.mixin import ModbusClientMixin # type: ignore
 import pymodbus.exceptions # type: ignore
+from array import array
 import json
+import time
 
+from FrameBuffer import FrameBuffer
+import JKFrames
+from ModbusCRC import ModbusCRC
 from ModbusDevice import ModbusDevice
+from ModbusPacer import ModbusPacer
 from Register import Register
+from RegisterTable import RegisterTable
 
 class JKBMS(ModbusDevice):
 
+    # Cell voltages are stored from 0x1200 onwards, one register per cell
+    CELL_VOLTAGES = 0x1200
+    MAX_CELLS = 32
+
+    # Register addresses are byte offsets, each register spanning two of them
+    ADDRESS_SCALE = 2
+
+    # Commands (to be prefixed by the BMS id and followed by the CRC) making a
+    # BMS answer with a full frame, as the master BMS does on its RS485-1 bus
+    STATUS_COMMAND = bytearray([0x10,0x16,0x20,0x00,0x01,0x02,0x00,0x00])
+    SETTINGS_COMMAND = bytearray([0x10,0x16,0x1E,0x00,0x01,0x02,0x00,0x00])
+    ABOUT_COMMAND = bytearray([0x10,0x16,0x1C,0x00,0x01,0x02,0x00,0x00])
+    RESPONSE_HEADER = bytearray([0x55,0xAA,0xEB,0x90])
+    FRAME_LENGTH = 308
+
+    SETTINGS_FRAME = 0x1
+    STATUS_FRAME = 0x2
+    ABOUT_FRAME = 0x3
+
+    REGISTERS = RegisterTable([
+        Register("BatChargeEN", 0x1070, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("BatDisChargeEN", 0x1074, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("BatCurrent", 0x1298, ModbusClientMixin.DATATYPE.INT32, .001),
+        Register("BatVol", 0x12E4, ModbusClientMixin.DATATYPE.UINT16, .01),
+        Register("CellCount", 0x106C, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.STATIC),
+        Register("CellVolAve", 0x1244, ModbusClientMixin.DATATYPE.UINT16, .001),
+        Register("HardwareVersion", 0x1410, ModbusClientMixin.DATATYPE.STRING, None, 4, refresh=Register.STATIC),
+        Register("ManufacturerDeviceID", 0x1400, ModbusClientMixin.DATATYPE.STRING, None, 8, refresh=Register.STATIC),
+        Register("DevAddr", 0x1108, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.STATIC),
+        Register("SOCCapRemain", 0x12A8, ModbusClientMixin.DATATYPE.INT32, 0.001),
+        Register("SOCCycleCount", 0x12B0, ModbusClientMixin.DATATYPE.UINT32, refresh=Register.SLOW),
+        Register("SOCFullChargeCap", 0x12AC, ModbusClientMixin.DATATYPE.UINT32, 0.001, refresh=Register.SLOW),
+        Register("SOCStateOfcharge", 0x12A6, ModbusClientMixin.DATATYPE.UINT16),
+        Register("SoftwareVersion", 0x1418, ModbusClientMixin.DATATYPE.STRING, None, 4, refresh=Register.STATIC),
+        Register("Alarms", 0x12A0, ModbusClientMixin.DATATYPE.UINT32)
+    ])
+
     def __init__(self,
                  name,
                  id,
-                 port=None):
+                 port=None,
+                 protocol="registers"):
         super().__init__(id)
         self.name = name
         self.port = port
-        self.cellVoltages = None
+        # "registers" reads each value with Modbus requests while "frames"
+        # asks the BMS for its status (and settings) frames, one request each
+        self.protocol = protocol
+        self.framesRead = {}
+        self.status = JKFrames.JKStatus()
+        # Raw cell voltages (in mV), updated in place on each read
+        self.cellMillivolts = array('H', bytes(2*JKBMS.MAX_CELLS))
+        self.cellCount = 0
+        self.cellMin = 0
+        self.cellMax = 0
+        self.cellMinIndex = 0
+        self.cellMaxIndex = 0
+        self.cellVoltagesRead = None
     
     def connect(self):
         if self.connection == None:
             self.connection = ModbusClient.ModbusSerialClient(port=self.port, stopbits=1, bytesize=8, parity='N', baudrate=115200, timeout=2)
             if self.connection.connect():
                 print("Successfully connected to BMS id %d" % self.id)
-                self.registers = [
-                    Register(self, "BatChargeEN", 0x1070, ModbusClientMixin.DATATYPE.UINT32),
-                    Register(self, "BatDisChargeEN", 0x1074, ModbusClientMixin.DATATYPE.UINT32),
-                    Register(self, "BatCurrent", 0x1298, ModbusClientMixin.DATATYPE.INT32, .001),
-                    Register(self, "BatVol", 0x12E4, ModbusClientMixin.DATATYPE.UINT16, .01),
-                    Register(self, "CellCount", 0x106C, ModbusClientMixin.DATATYPE.UINT32),
-                    Register(self, "CellVolAve", 0x1244, ModbusClientMixin.DATATYPE.UINT16, .001),
-                    Register(self, "HardwareVersion", 0x1410, ModbusClientMixin.DATATYPE.STRING, None, 4),
-                    Register(self, "ManufacturerDeviceID", 0x1400, ModbusClientMixin.DATATYPE.STRING, None, 8),
-                    Register(self, "DevAddr", 0x1108, ModbusClientMixin.DATATYPE.UINT32),
-                    Register(self, "SOCCapRemain", 0x12A8, ModbusClientMixin.DATATYPE.INT32, 0.001),
-                    Register(self, "SOCCycleCount", 0x12B0, ModbusClientMixin.DATATYPE.UINT32),
-                    Register(self, "SOCFullChargeCap", 0x12AC, ModbusClientMixin.DATATYPE.UINT32, 0.001),
-                    Register(self, "SOCStateOfcharge", 0x12A6, ModbusClientMixin.DATATYPE.UINT16),
-                    Register(self, "SoftwareVersion", 0x1418, ModbusClientMixin.DATATYPE.STRING, None, 4),
-                    Register(self, "Alarms", 0x12A0, ModbusClientMixin.DATATYPE.UINT32)
-                ]
+                self.connection.pacer = ModbusPacer.rtu(115200)
+                if self.protocol == "frames":
+                    self.framesRead.clear()
+                else:
+                    self.setRegisters(JKBMS.REGISTERS)
             else:
                 print("Cannot connect to BMS id %d" % self.id)
                 self.connection = None 
@@ -57,52 +102,193 @@ class JKBMS(ModbusDevice):
 
     def setChargeMode(self, mode):
         register = self.getRegister("BatChargeEN")
-        register.setValue(self.connection, mode)
+        register.setValue(self, mode)
 
     def setDischargeMode(self, mode):
         register = self.getRegister("BatDisChargeEN")
-        register.setValue(self.connection, mode)
+        register.setValue(self, mode)
+
+    # Store raw cell voltages (in mV) and compute the lowest and highest
+    # cells in the same pass. Unused cells (0 mV) are ignored.
+    def setCellVoltages(self, millivolts):
+        count = 0
+        low = high = 0
+        for (i, mv) in enumerate(millivolts[:JKBMS.MAX_CELLS]):
+            if mv == 0:
+                break
+            self.cellMillivolts[i] = mv
+            if count == 0 or mv < self.cellMillivolts[low]:
+                low = i
+            if count == 0 or mv > self.cellMillivolts[high]:
+                high = i
+            count += 1
+
+        self.cellCount = count
+        self.cellMinIndex = low
+        self.cellMaxIndex = high
+        self.cellMin = self.cellMillivolts[low] if count > 0 else 0
+        self.cellMax = self.cellMillivolts[high] if count > 0 else 0
+        self.cellVoltagesRead = time.monotonic()
 
     def getCellVoltages(self, reload=False):
-        if self.connection == None:
-            return
+        # Cell voltages are fast moving values, we refresh them as such
+        if self.cellVoltagesRead != None and (time.monotonic() - self.cellVoltagesRead) >= Register.refresh_intervals[Register.FAST]:
+            reload = True
 
-        if self.cellVoltages == None or reload == True:
-            count = self.getRegister('CellCount').value
-            values = []
+        # With frames, cell voltages come with the status frame
+        if self.protocol == "frames":
+            if reload == True:
+                self.update()
+        elif self.connection != None and (self.cellVoltagesRead == None or reload == True):
+            count = self.getRegisterValue('CellCount')
+            if count == None:
+                return None
 
-            recv = self.connection.read_holding_registers(address=0x1200, count=count, slave=self.id)
+            recv = ModbusPacer.forConnection(self.connection).execute(self.id, self.connection.read_holding_registers, address=JKBMS.CELL_VOLTAGES, count=min(count, JKBMS.MAX_CELLS))
             if not isinstance(recv, pymodbus.pdu.register_message.ReadHoldingRegistersResponse):
                 return None
-            
-            values = self.connection.convert_from_registers(recv.registers, data_type=self.connection.DATATYPE.UINT16)
 
-            for i in range(0, count):
-                r = Register(self, f'CellVol{i}', 0x1200+i*2, ModbusClient.ModbusSerialClient.DATATYPE.UINT16, 0.001)
-                r.value = round(values[i]*0.001,3)
-                values[i] = r.value
-                self.registers.append(r)
-            
-            self.cellVoltages = values
+            self.setCellVoltages(recv.registers)
+
+        if self.cellVoltagesRead == None:
+            return None
+
+        return [mv/1000 for mv in self.cellMillivolts[:self.cellCount]]
+
+    # Cell voltages (in V) and their spread, as published
+    def cellValues(self):
+        values = {}
+        for i in range(self.cellCount):
+            values[f'CellVol{i}'] = self.cellMillivolts[i]/1000
+
+        if self.cellCount > 0:
+            values["CellVolMin"] = self.cellMin/1000
+            values["CellVolMax"] = self.cellMax/1000
+            values["CellVolDelta"] = (self.cellMax-self.cellMin)/1000
+            values["CellVolMinIndex"] = self.cellMinIndex
+            values["CellVolMaxIndex"] = self.cellMaxIndex
+
+        return values
+
+    @staticmethod
+    def checksum(frame):
+        return sum(frame[0:JKBMS.FRAME_LENGTH-9]) & 0xFF
+
+    # Build the request for one of the frame commands, sent to a BMS id
+    @staticmethod
+    def frameCommand(bms_id, command):
+        request = bytearray([bms_id]) + command
+        return request + ModbusCRC.compute(request)
+
+    @staticmethod
+    def isValidFrame(frame):
+        return JKBMS.checksum(frame) == frame[JKBMS.FRAME_LENGTH-9]
+
+    # Buffer in which frames received from the BMS are looked for
+    @staticmethod
+    def frameBuffer(capacity=4096):
+        return FrameBuffer(JKBMS.RESPONSE_HEADER, JKBMS.FRAME_LENGTH, JKBMS.isValidFrame, capacity)
+
+    # The BMS id is at the end of the frame, but not at the same place for
+    # settings frames
+    @staticmethod
+    def frameBmsId(frame):
+        if frame[4] == JKBMS.SETTINGS_FRAME:
+            return frame[270]
+        return frame[300]
+
+    def decodeFrame(self, frame):
+        frame_type = frame[4]
+        match frame_type:
+            case JKBMS.SETTINGS_FRAME:
+                (self.values["CellCount"],self.values["BatChargeEN"],self.values["BatDisChargeEN"]) = JKFrames.decodeSettings(frame)
+            case JKBMS.STATUS_FRAME:
+                # Values are only scaled when used, see update()
+                self.setCellVoltages(self.status.decode(frame))
+            case JKBMS.ABOUT_FRAME:
+                (self.values["ManufacturerDeviceID"],self.values["HardwareVersion"],self.values["SoftwareVersion"]) = JKFrames.decodeAbout(frame)
+            case _:
+                return None
+
+        self.framesRead[frame_type] = time.monotonic()
+        return frame_type
+
+    # Send a frame command and wait for the frame it triggers, which is
+    # decoded. Returns the frame type or None if nothing valid was received.
+    def requestFrame(self, command):
+        pacer = ModbusPacer.forConnection(self.connection)
+        pacer.wait(self.id)
+
+        start = time.monotonic()
+        deadline = start + self.connection.comm_params.timeout_connect
+        buffer = JKBMS.frameBuffer(2*JKBMS.FRAME_LENGTH)
+        frame = None
+        try:
+            self.connection.send(JKBMS.frameCommand(self.id, command))
+            while frame == None and time.monotonic() < deadline:
+                buffer.append(self.connection.recv(JKBMS.FRAME_LENGTH))
+                for candidate in buffer.frames():
+                    if JKBMS.frameBmsId(candidate) == self.id:
+                        frame = candidate
+        except pymodbus.exceptions.ConnectionException:
+            frame = None
+        pacer.last_frame = time.monotonic()
+
+        if frame == None:
+            pacer.failed(self.id)
+            return None
+
+        pacer.succeeded(self.id, pacer.last_frame - start)
+        return self.decodeFrame(frame)
+
+    # Fetch the frames which are due: the status frame replaces all fast
+    # registers, the settings frame the slow ones. The about frame is only
+    # asked for once per connection.
+    def updateFrames(self):
+        now = time.monotonic()
+        due = [
+            (JKBMS.STATUS_FRAME, JKBMS.STATUS_COMMAND, Register.refresh_intervals[Register.FAST]),
+            (JKBMS.SETTINGS_FRAME, JKBMS.SETTINGS_COMMAND, Register.refresh_intervals[Register.SLOW]),
+        ]
+        for (frame_type, command, interval) in due:
+            last_read = self.framesRead.get(frame_type, None)
+            if last_read == None or (now - last_read) >= interval:
+                self.requestFrame(command)
+
+        if JKBMS.ABOUT_FRAME not in self.framesRead:
+            # Don't retry if unanswered, the master BMS never answers it
+            self.framesRead[JKBMS.ABOUT_FRAME] = now
+            self.requestFrame(JKBMS.ABOUT_COMMAND)
+
+    # Refresh our values, using whichever protocol was configured
+    def update(self):
+        if self.connection != None:
+            if self.protocol == "frames":
+                self.updateFrames()
+            elif self.registers != None:
+                self.values.update(self.dump())
+                self.getCellVoltages()
 
-        return self.cellVoltages
+        if self.status.pending:
+            self.values.update(self.status.values())
 
     def publish(self, dict):
         topic_soc = "bms-%d" % self.id
 
-        if self.registers != None:
-            self.values.update(self.dump())
+        self.update()
 
+        self.values.update(self.cellValues())
         self.values["name"] = self.name
         dict[topic_soc] = self.values
 
     def __str__(self):
-        self.getCellVoltages()
-        return super().__str__()
+        self.update()
+        values = dict(self.values)
+        values.update(self.cellValues())
+        return json.dumps(values, indent=2)
     
     def formattedOutput(self):
-        if self.registers != None:
-            self.values.update(self.dump())
+        self.update()
 
         bms_model = self.values.get('ManufacturerDeviceID')
         bms_hw_version = self.values.get('HardwareVersion')
@@ -0,0 +1,150 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import struct
+import sys
+import time
+
+# Layout of the JK BMS frames. Offsets are from the start of the frame, the
+# payload starting after the 4 bytes header, the frame type and a counter.
+PAYLOAD = 6
+
+STATUS_CELLS = struct.Struct("<32H")
+STATUS_CELLS_OFFSET = PAYLOAD + 0
+STATUS_CELL_AVERAGE = struct.Struct("<H")
+STATUS_CELL_AVERAGE_OFFSET = PAYLOAD + 68
+#STATUS_RESISTANCES = struct.Struct("<32H")
+#STATUS_RESISTANCES_OFFSET = PAYLOAD + 74
+STATUS_BATTERY = struct.Struct("<IIixxxxI")
+STATUS_BATTERY_OFFSET = PAYLOAD + 144
+STATUS_SOC = struct.Struct("<BBiII")
+STATUS_SOC_OFFSET = PAYLOAD + 166
+
+SETTINGS = struct.Struct("<III")
+SETTINGS_OFFSET = PAYLOAD + 108
+
+ABOUT = struct.Struct("<15sx7sx7s")
+ABOUT_OFFSET = PAYLOAD + 0
+
+# Raw values of a status frame. Frames are decoded into the same record over
+# and over, values being scaled only when they are published.
+class JKStatus(object):
+
+    __slots__ = ('CellVolAve', 'BatVol', 'BatWatt', 'BatCurrent', 'Alarms', 'BalanSta',
+                 'SOCStateOfcharge', 'SOCCapRemain', 'SOCFullChargeCap', 'SOCCycleCount', 'pending')
+
+    def __init__(self):
+        self.pending = False
+
+    # Decode a status frame (bytes, bytearray or memoryview) and return the
+    # raw cell voltages, in mV
+    def decode(self, frame):
+        (self.CellVolAve,) = STATUS_CELL_AVERAGE.unpack_from(frame, STATUS_CELL_AVERAGE_OFFSET)
+        (self.BatVol, self.BatWatt, self.BatCurrent, self.Alarms) = STATUS_BATTERY.unpack_from(frame, STATUS_BATTERY_OFFSET)
+        (self.BalanSta, self.SOCStateOfcharge, self.SOCCapRemain, self.SOCFullChargeCap, self.SOCCycleCount) = STATUS_SOC.unpack_from(frame, STATUS_SOC_OFFSET)
+        self.pending = True
+        return STATUS_CELLS.unpack_from(frame, STATUS_CELLS_OFFSET)
+
+    def values(self):
+        self.pending = False
+        return {
+            "CellVolAve": self.CellVolAve / 1000,
+            "BatVol": self.BatVol / 1000,
+            "BatWatt": self.BatWatt / 1000,
+            "BatCurrent": self.BatCurrent / 1000,
+            "Alarms": self.Alarms,
+            "BalanSta": self.BalanSta,
+            "SOCStateOfcharge": self.SOCStateOfcharge,
+            "SOCCapRemain": self.SOCCapRemain / 1000,
+            "SOCFullChargeCap": self.SOCFullChargeCap / 1000,
+            "SOCCycleCount": self.SOCCycleCount,
+        }
+
+# Return the (CellCount, BatChargeEN, BatDisChargeEN) tuple of a settings frame
+def decodeSettings(frame):
+    return SETTINGS.unpack_from(frame, SETTINGS_OFFSET)
+
+# Return the (ManufacturerDeviceID, HardwareVersion, SoftwareVersion) tuple of
+# an about frame
+def decodeAbout(frame):
+    return tuple(str(value, "UTF-8", "ignore").rstrip("\x00") for value in ABOUT.unpack_from(frame, ABOUT_OFFSET))
+
+# How the status frames were decoded before, kept for comparison
+def decodeStatusSliced(frame):
+    bytes = frame[PAYLOAD:]
+    voltages = list(map(lambda x: x/1000, struct.unpack("<32H", bytes[:64])))
+    values = {}
+    for i in range(32):
+        if voltages[i] == 0:
+            break
+        values[f'CellVol{i}'] = voltages[i]
+    (CellVolAve,) = struct.unpack("<H", bytes[68:70])
+    (BatVol,BatWatt,BatCurrent,Alarm) = struct.unpack("<IIixxxxI", bytes[144:164])
+    (BalanSta,SOCStateOfcharge,SOCCapRemain,SOCFullChargeCap,SOCCycleCount) = struct.unpack("<BBiII", bytes[166:180])
+    values.update({
+        "CellVolAve": CellVolAve / 1000,
+        "BatVol": BatVol / 1000,
+        "BatWatt": BatWatt / 1000,
+        "BatCurrent": BatCurrent / 1000,
+        "Alarm": Alarm,
+        "BalanSta": BalanSta,
+        "SOCStateOfcharge": SOCStateOfcharge,
+        "SOCCapRemain": SOCCapRemain / 1000,
+        "SOCFullChargeCap": SOCFullChargeCap / 1000,
+        "SOCCycleCount": SOCCycleCount,
+    })
+    return values
+
+# Microbenchmark of the status frame decoding. Recorded frames can be given
+# as a raw capture of the bus (ie, cat /dev/ttyUSB0 > capture.bin), otherwise
+# a synthetic 16 cells frame is used.
+if __name__ == "__main__":
+    from FrameBuffer import FrameBuffer
+    from JKBMS import JKBMS
+
+    frames = []
+    if len(sys.argv) > 1:
+        buffer = FrameBuffer(JKBMS.RESPONSE_HEADER, JKBMS.FRAME_LENGTH, JKBMS.isValidFrame, 1 << 20)
+        with open(sys.argv[1], "rb") as f:
+            while True:
+                data = f.read(1 << 16)
+                if len(data) == 0:
+                    break
+                buffer.append(data)
+                frames += [bytes(frame) for frame in buffer.frames() if frame[4] == JKBMS.STATUS_FRAME]
+    else:
+        frame = bytearray(JKBMS.FRAME_LENGTH)
+        frame[0:4] = JKBMS.RESPONSE_HEADER
+        frame[4] = JKBMS.STATUS_FRAME
+        STATUS_CELLS.pack_into(frame, STATUS_CELLS_OFFSET, *([3300]*16 + [0]*16))
+        STATUS_BATTERY.pack_into(frame, STATUS_BATTERY_OFFSET, 52800, 1000, -20000, 0)
+        STATUS_SOC.pack_into(frame, STATUS_SOC_OFFSET, 0, 80, 224000, 280000, 12)
+        frames.append(bytes(frame))
+
+    if len(frames) == 0:
+        print("No status frame found")
+        sys.exit(1)
+
+    count = 100000
+    bms = JKBMS("bench", 0)
+
+    start = time.perf_counter()
+    for i in range(count):
+        decodeStatusSliced(frames[i % len(frames)])
+    sliced = count/(time.perf_counter()-start)
+
+    start = time.perf_counter()
+    for i in range(count):
+        bms.decodeFrame(memoryview(frames[i % len(frames)]))
+    compiled = count/(time.perf_counter()-start)
+
+    print(f"{len(frames)} status frame(s), {count} decodes")
+    print(f"sliced:   {sliced:.0f} frames/s")
+    print(f"compiled: {compiled:.0f} frames/s ({compiled/sliced:.1f}x)")
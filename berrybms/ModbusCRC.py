@@ -0,0 +1,57 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+
+def _table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for i in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+# CRC-16/MODBUS, computed one byte at a time from a lookup table. Data can be
+# fed in chunks, as it arrives:
+#
+#   crc = ModbusCRC()
+#   crc.update(chunk1)
+#   crc.update(chunk2)
+#   crc.digest()
+class ModbusCRC(object):
+
+    TABLE = _table()
+
+    def __init__(self, data=None):
+        self.crc = 0xFFFF
+        if data != None:
+            self.update(data)
+
+    def update(self, data):
+        crc = self.crc
+        table = ModbusCRC.TABLE
+        for byte in data:
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        self.crc = crc
+        return self
+
+    def value(self):
+        return self.crc
+
+    # The CRC as sent on the wire, low byte first
+    def digest(self):
+        return self.crc.to_bytes(2, "little")
+
+    @staticmethod
+    def compute(data):
+        return ModbusCRC(data).digest()
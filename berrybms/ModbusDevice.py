@@ -9,40 +9,99 @@
 # later version.
 #
 import json
+import time
+
+from ModbusPacer import ModbusPacer
+from ModbusReadPlanner import ModbusReadPlanner
 
 class ModbusDevice(object):
 
+    # Number of consecutive failed requests after which we consider
+    # the connection to be broken
+    MAX_FAILURES = 3
+
+    # Addresses spanned by one register, see ModbusReadPlanner
+    ADDRESS_SCALE = 1
+
     def __init__(self, id, serial_number=None):
         self.id = id
         self.serial_number = serial_number
         self.connection = None
         self.registers = None
         self.values = {}
+        self.last_read = {}
+        self.planner = ModbusReadPlanner(scale=self.ADDRESS_SCALE)
+
+    # Use the register table of our device class. Everything is considered
+    # due for a read again, as we expect this to be done upon connection.
+    def setRegisters(self, registers):
+        self.registers = registers
+        for register in registers:
+            self.values.setdefault(register.name, None)
+        self.last_read.clear()
 
     def disconnect(self):
         if self.connection != None:
             #print("Closing connnection...")
             self.connection.close()
+            self.connection = None
 
-    # Return the initialized value of a register
+    # Close and reopen our connection, keeping the same client (and thus
+    # the devices sharing it) around
+    def reconnect(self):
+        self.connection.close()
+        if not self.connection.connect():
+            return None
+
+        ModbusPacer.forConnection(self.connection).failures = 0
+        return self.connection
+
+    def isHealthy(self):
+        if self.connection == None or not self.connection.is_socket_open():
+            return False
+        return ModbusPacer.forConnection(self.connection).failures < ModbusDevice.MAX_FAILURES
+
+    # Return a register, making sure its value was fetched
     def getRegister(self, name):
-        for register in self.registers:
-            if name == register.name:
-                register.getValue(self.connection)
-                return register
-        return None
-    
-        # Return the initialized value of a register
+        if self.registers == None:
+            return None
+
+        register = self.registers.get(name)
+        if register != None:
+            register.getValue(self)
+        return register
+
+    # Return the initialized value of a register
     def getRegisterValue(self, name):
-        for register in self.registers:
-            if name == register.name:
-                return register.getValue(self.connection)
+        if self.registers == None:
+            return None
+
+        register = self.registers.get(name)
+        if register != None:
+            return register.getValue(self)
         return None
 
+    # Measured request/response turnaround time (in seconds) of the device
+    def getTurnaround(self):
+        if self.connection == None:
+            return None
+        return ModbusPacer.forConnection(self.connection).getTurnaround(self.id)
+
+    # Registers which are due for a refresh, see Register.isDue()
+    def dueRegisters(self):
+        now = time.monotonic()
+        return [register for register in self.registers if register.isDue(self, now)]
+
     def dump(self):
+        # We only fetch what isn't known yet or is due for a refresh,
+        # coalescing contiguous registers into as few requests as possible
+        pending = self.dueRegisters()
+        if len(pending) > 0:
+            self.planner.read(self, pending)
+
         values = {}
         for register in self.registers:
-            values[register.name] = register.getValue(self.connection)
+            values[register.name] = self.values[register.name]
 
         return values
     
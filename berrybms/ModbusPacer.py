@@ -0,0 +1,121 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import pymodbus.exceptions # type: ignore
+import pymodbus.pdu # type: ignore
+import time
+
+class ModbusPacer(object):
+
+    # Exception codes for which the device tells us to come back later
+    BUSY_EXCEPTIONS = {
+        0x05,   # Acknowledge
+        0x06,   # Slave Device Busy
+    }
+
+    # Exception codes a gateway (InsightHome) returns when the target device
+    # did not answer in time
+    TIMEOUT_EXCEPTIONS = {
+        0x0B,   # Gateway Target Device Failed to Respond
+    }
+
+    def __init__(self,
+                 inter_frame_gap=0.0,
+                 min_backoff=0.1,
+                 max_backoff=5.0):
+        self.inter_frame_gap = inter_frame_gap
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.last_frame = 0.0
+        self.backoff = {}
+        self.retry_at = {}
+        self.turnaround = {}
+        # Consecutive failed requests, whatever the device, on this connection
+        self.failures = 0
+
+    # Modbus RTU requires 3.5 character times of silence between frames. Above
+    # 19200 bauds, the specification recommends a fixed 1.75ms value instead.
+    @staticmethod
+    def rtu(baudrate, bits_per_char=11):
+        if baudrate > 19200:
+            return ModbusPacer(0.00175)
+        return ModbusPacer(3.5 * bits_per_char / baudrate)
+
+    # Return the pacer of a connection, attaching one without any gap
+    # if the connection was created without one
+    @staticmethod
+    def forConnection(c):
+        pacer = getattr(c, 'pacer', None)
+        if pacer == None:
+            pacer = ModbusPacer()
+            c.pacer = pacer
+        return pacer
+
+    # Measured request/response turnaround (in seconds) for a device, smoothed
+    # over the last transactions
+    def getTurnaround(self, slave):
+        return self.turnaround.get(slave, None)
+
+    def wait(self, slave):
+        now = time.monotonic()
+        delay = max(self.last_frame + self.inter_frame_gap, self.retry_at.get(slave, 0)) - now
+        if delay > 0:
+            time.sleep(delay)
+
+    # Run a pymodbus request (read_holding_registers, write_registers, ...) for
+    # a device, honoring the inter-frame gap and any backoff for that device.
+    # Timeouts are reported as a None response.
+    def execute(self, slave, request, *args, **kwargs):
+        self.wait(slave)
+
+        start = time.monotonic()
+        try:
+            response = request(*args, slave=slave, **kwargs)
+        except pymodbus.exceptions.ModbusIOException:
+            response = None
+        self.last_frame = time.monotonic()
+
+        if ModbusPacer.isTransient(response):
+            self.failed(slave)
+        else:
+            self.succeeded(slave, self.last_frame - start)
+
+        return response
+
+    # True when a request failed because the device timed out or was busy,
+    # in which case it is worth retrying it later as is
+    @staticmethod
+    def isTransient(response):
+        if response == None:
+            return True
+        if isinstance(response, pymodbus.pdu.ExceptionResponse):
+            return ModbusPacer.isTransientException(response.exception_code)
+        return False
+
+    @staticmethod
+    def isTransientException(exception_code):
+        return exception_code in ModbusPacer.BUSY_EXCEPTIONS or exception_code in ModbusPacer.TIMEOUT_EXCEPTIONS
+
+    def succeeded(self, slave, turnaround):
+        self.failures = 0
+        self.backoff.pop(slave, None)
+        self.retry_at.pop(slave, None)
+
+        previous = self.turnaround.get(slave, None)
+        if previous == None:
+            self.turnaround[slave] = turnaround
+        else:
+            self.turnaround[slave] = previous*0.8 + turnaround*0.2
+
+    def failed(self, slave):
+        self.failures += 1
+        backoff = min(self.backoff.get(slave, self.min_backoff/2)*2, self.max_backoff)
+        self.backoff[slave] = backoff
+        self.retry_at[slave] = time.monotonic() + backoff
@@ -0,0 +1,118 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import pymodbus.pdu # type: ignore
+import asyncio
+
+from ModbusPacer import ModbusPacer
+
+class ModbusReadPlanner(object):
+
+    # Largest hole (in registers) we accept to read, and discard, between two
+    # registers in order to fetch them in the same request
+    max_gap = 8
+
+    # Largest number of registers fetched in a single request. The Modbus
+    # specification caps read_holding_registers to 125 registers.
+    max_window = 100
+
+    def __init__(self,
+                 max_gap=None,
+                 max_window=None,
+                 scale=1):
+        # Addresses spanned by one register. Devices such as the JK BMS use
+        # byte addresses, each 16 bits register spanning two of them.
+        self.scale = scale
+        self.max_gap = ModbusReadPlanner.max_gap if max_gap == None else max_gap
+        self.max_window = ModbusReadPlanner.max_window if max_window == None else max_window
+        # Windows (address, count) the device refused to serve in one request. We
+        # remember them so we don't waste a round trip on them every cycle.
+        self.rejected = set()
+
+    @staticmethod
+    def configure(config):
+        if config == None:
+            return
+        ModbusReadPlanner.max_gap = int(config.get('max_gap', ModbusReadPlanner.max_gap))
+        ModbusReadPlanner.max_window = min(int(config.get('max_window', ModbusReadPlanner.max_window)), 125)
+
+    # Group registers in the fewest windows possible. Each window is a
+    # [address, count, registers] list, registers being sorted by address.
+    # Counts, gaps and windows sizes are in registers, whatever the scale.
+    def plan(self, registers):
+        windows = []
+        scale = self.scale
+
+        for register in sorted(registers, key=lambda r: r.address):
+            end = register.address + register.length*scale
+
+            if len(windows) > 0:
+                window = windows[-1]
+                (address, count, members) = window
+                gap = (register.address - (address + count*scale)) // scale
+                span = -(-(end - address) // scale)
+                if gap <= self.max_gap and span <= self.max_window:
+                    window[1] = max(count, span)
+                    members.append(register)
+                    continue
+
+            windows.append([register.address, register.length, [register]])
+
+        return windows
+
+    # Fetch all registers, one request per window, and decode every register
+    # from the returned buffer. Windows rejected by the device are retried
+    # (now and on subsequent calls) as one request per register. Windows that
+    # timed out are left unread, they'll be retried on the next call.
+    def read(self, device, registers):
+        c = device.connection
+        for (address, count, members) in self.plan(registers):
+            if len(members) == 1 or (address, count) in self.rejected:
+                for register in members:
+                    register.getValue(device, True)
+                continue
+
+            recv = ModbusPacer.forConnection(c).execute(device.id, c.read_holding_registers, address=address, count=count)
+            if ModbusPacer.isTransient(recv):
+                continue
+
+            if not isinstance(recv, pymodbus.pdu.register_message.ReadHoldingRegistersResponse):
+                #print(f"Window {address:x}/{count} rejected by device id {id}, falling back to single reads")
+                self.rejected.add((address, count))
+                for register in members:
+                    register.getValue(device, True)
+                continue
+
+            for register in members:
+                offset = (register.address - address) // self.scale
+                register.decode(device, recv.registers[offset:offset+register.length])
+
+    # Same as read() but through a ModbusTcpPipeline, all windows being
+    # requested concurrently
+    async def readAsync(self, pipeline, device, registers):
+        windows = self.plan(registers)
+        await asyncio.gather(*[self.readWindowAsync(pipeline, device, address, count, members) for (address, count, members) in windows])
+
+    async def readWindowAsync(self, pipeline, device, address, count, members):
+        if len(members) > 1 and (address, count) not in self.rejected:
+            (registers, exception_code) = await pipeline.readHoldingRegisters(device.id, address, count)
+
+            if registers != None:
+                for register in members:
+                    offset = (register.address - address) // self.scale
+                    register.decode(device, registers[offset:offset+register.length])
+                return
+
+            if exception_code == None or ModbusPacer.isTransientException(exception_code):
+                return
+
+            self.rejected.add((address, count))
+
+        await asyncio.gather(*[register.getValueAsync(device, pipeline, True) for register in members])
@@ -0,0 +1,147 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import asyncio
+import struct
+
+# Minimal asyncio Modbus/TCP client keeping several transactions in flight on
+# a single connection. Each request gets its own MBAP transaction identifier
+# and responses are matched back to requests using it, whatever the order in
+# which the gateway answers.
+class ModbusTcpPipeline(object):
+
+    # Transaction id, protocol id, length, unit id
+    MBAP_HEADER = struct.Struct(">HHHB")
+
+    # Function code, address, count
+    READ_REQUEST = struct.Struct(">BHH")
+
+    READ_HOLDING_REGISTERS = 0x03
+
+    def __init__(self,
+                 host,
+                 port,
+                 window=8,
+                 timeout=2):
+        self.host = host
+        self.port = port
+        self.window = window
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+        self.semaphore = None
+        self.pending = dict()
+        self.transaction_id = 0
+
+    def isConnected(self):
+        return self.writer != None and not self.writer.is_closing()
+
+    async def connect(self):
+        if self.isConnected():
+            return True
+
+        try:
+            (self.reader, self.writer) = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.reader = None
+            self.writer = None
+            return False
+
+        self.semaphore = asyncio.Semaphore(self.window)
+        self.receiver = asyncio.create_task(self.receive())
+        return True
+
+    async def close(self):
+        if self.receiver != None:
+            self.receiver.cancel()
+            self.receiver = None
+        if self.writer != None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.writer = None
+        self.failPending()
+
+    def failPending(self):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_result(None)
+        self.pending.clear()
+
+    # Dispatch every response to the request waiting for it
+    async def receive(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(ModbusTcpPipeline.MBAP_HEADER.size)
+                (transaction_id, protocol_id, length, unit_id) = ModbusTcpPipeline.MBAP_HEADER.unpack(header)
+
+                # The length covers the unit id and at least a function code.
+                # Past a bad header we can't find the next response, so we give
+                # up on the connection.
+                if protocol_id != 0 or length < 2:
+                    print(f"Invalid Modbus/TCP header (protocol {protocol_id}, length {length}), closing the connection")
+                    break
+
+                pdu = await self.reader.readexactly(length-1)
+
+                future = self.pending.pop(transaction_id, None)
+                if future != None and not future.done():
+                    future.set_result(pdu)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+
+        # The connection is gone, we wake up everyone still waiting
+        if self.writer != None:
+            self.writer.close()
+        self.failPending()
+
+    def nextTransactionId(self):
+        self.transaction_id = (self.transaction_id % 0xFFFF) + 1
+        return self.transaction_id
+
+    # Return a (registers, exception_code) tuple. registers is None if the device
+    # answered with an exception or if no answer was received in time, in which
+    # case exception_code is also None.
+    async def readHoldingRegisters(self, slave, address, count):
+        if not self.isConnected():
+            return (None, None)
+
+        async with self.semaphore:
+            transaction_id = self.nextTransactionId()
+            future = asyncio.get_running_loop().create_future()
+            self.pending[transaction_id] = future
+
+            pdu = ModbusTcpPipeline.READ_REQUEST.pack(ModbusTcpPipeline.READ_HOLDING_REGISTERS, address, count)
+            self.writer.write(ModbusTcpPipeline.MBAP_HEADER.pack(transaction_id, 0, len(pdu)+1, slave) + pdu)
+
+            try:
+                pdu = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.pending.pop(transaction_id, None)
+                return (None, None)
+
+        if pdu == None or len(pdu) < 2:
+            return (None, None)
+
+        if pdu[0] & 0x80:
+            return (None, pdu[1])
+
+        byte_count = pdu[1]
+        if len(pdu) < 2+byte_count:
+            return (None, None)
+
+        registers = list(struct.unpack(f">{byte_count//2}H", pdu[2:2+byte_count]))
+        if len(registers) != count:
+            return (None, None)
+
+        return (registers, None)
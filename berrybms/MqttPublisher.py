@@ -0,0 +1,131 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import collections
+import threading
+
+import paho.mqtt.client as paho # type: ignore
+
+from DeltaFilter import DeltaFilter
+from PayloadCodec import PayloadCodec
+
+# Long-lived MQTT connection shared by everything publishing updates (the
+# polling loop and the sniffers). paho's network thread connects, sends and
+# reconnects in the background so publish() never blocks the caller. While
+# the broker can't be reached, messages are kept in a bounded queue, the
+# oldest ones being dropped first.
+class MqttPublisher(object):
+
+    MAX_QUEUED = 100
+    MAX_RECONNECT_DELAY = 300
+
+    def __init__(self,
+                 config):
+        self.host = config['mqtt']['host']
+        self.port = int(config['mqtt']['port'])
+        self.queue = collections.deque(maxlen=int(config['mqtt'].get('max_queued', MqttPublisher.MAX_QUEUED)))
+        self.lock = threading.Lock()
+        self.connected = False
+        self.dropped = 0
+        self.paho_client = None
+        self.codec = PayloadCodec.fromConfig(config['mqtt'].get('payload', None))
+        # When configured, only changes are published
+        self.delta = DeltaFilter.fromConfig(config['mqtt'].get('delta', None))
+        # "single" publishes all devices in one document on the berrybms topic,
+        # "devices" publishes each device on its own retained topic
+        topics = config['mqtt'].get('topics', dict())
+        self.layout = topics.get('layout', "single")
+        self.leaves = topics.get('leaves', False)
+
+    def start(self):
+        if self.paho_client != None:
+            return
+
+        self.paho_client = paho.Client()
+        self.paho_client.on_connect = self.on_connect
+        self.paho_client.on_disconnect = self.on_disconnect
+        self.paho_client.reconnect_delay_set(min_delay=1, max_delay=MqttPublisher.MAX_RECONNECT_DELAY)
+        # The connection itself is established (and reestablished) by the network thread
+        self.paho_client.connect_async(self.host, self.port, 60)
+        self.paho_client.loop_start()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            print(f"Couldn't connect to the MQTT broker ({rc}), the GUI part if used, won't be updated.")
+            return
+
+        with self.lock:
+            self.connected = True
+            while len(self.queue) > 0:
+                (topic, payload, retain) = self.queue.popleft()
+                self.paho_client.publish(topic, payload, retain=retain)
+
+    def on_disconnect(self, client, userdata, *args):
+        with self.lock:
+            self.connected = False
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            if self.connected:
+                self.paho_client.publish(topic, payload, retain=retain)
+                return
+
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append((topic, payload, retain))
+
+    # Topic of a device, from its key (ie, bms-1 -> berrybms/bms/1)
+    @staticmethod
+    def deviceTopic(key, topic="berrybms"):
+        (type, separator, id) = key.partition('-')
+        return f"{topic}/{type}/{id}"
+
+    # Publish the values of devices, as a dict keyed by device (see the
+    # publish() method of each device)
+    def publishDevices(self, all_devices, topic="berrybms"):
+        if self.layout == "devices":
+            self.publishEachDevice(all_devices, topic)
+            return
+
+        if self.delta != None:
+            with self.lock:
+                all_devices = self.delta.filterAll(all_devices)
+            if len(all_devices) == 0:
+                return
+
+        self.publish(topic, self.codec.encode(all_devices))
+
+    # Each device's topic gets all its values, retained so that subscribers get
+    # the current state as soon as they subscribe. With leaves, each value is
+    # also published (retained) on its own topic under the device's one.
+    def publishEachDevice(self, all_devices, topic):
+        for (key, values) in all_devices.items():
+            changed = values
+            if self.delta != None:
+                with self.lock:
+                    changed = self.delta.filter(key, values)
+                if len(changed) == 0:
+                    continue
+
+            device_topic = MqttPublisher.deviceTopic(key, topic)
+            self.publish(device_topic, self.codec.encode(values), retain=True)
+            if self.leaves:
+                for (field, value) in changed.items():
+                    self.publish(f"{device_topic}/{field}", self.codec.encode(value), retain=True)
+
+    def stop(self):
+        if self.paho_client == None:
+            return
+
+        # Disconnecting first lets the network loop flush what's queued
+        self.paho_client.disconnect()
+        self.paho_client.loop_stop()
+        self.paho_client = None
+        self.connected = False
@@ -0,0 +1,159 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import json
+import sys
+import time
+
+try:
+    import msgpack # type: ignore
+except ImportError:
+    msgpack = None
+
+# Encoding of MQTT payloads. JSON payloads are sent as is, as they always
+# were. Binary payloads start with a version byte, which can never be the
+# first byte of a JSON document, so that consumers can decode whatever
+# producers send (see PayloadCodec.decode()).
+#
+# Version 1 is MessagePack, floats being sent as scaled integers: a float
+# with n decimals (n <= 9) is sent as a MessagePack extension of type n
+# holding the value multiplied by 10^n, as a little-endian signed integer.
+# 3.305 is sent as 3305 with type 3, which is how it comes out of the
+# registers before being scaled.
+class PayloadCodec(object):
+
+    MSGPACK_V1 = 0x01
+
+    POWERS = [10**i for i in range(10)]
+
+    # Largest number of decimals floats are rounded to by default
+    DECIMALS = 3
+
+    def __init__(self,
+                 format="json",
+                 decimals=None):
+        self.format = format
+        self.decimals = PayloadCodec.DECIMALS if decimals == None else min(int(decimals), 9)
+
+    @staticmethod
+    def fromConfig(config):
+        if config == None:
+            return PayloadCodec()
+
+        format = config.get('format', "json")
+        if format == "msgpack" and msgpack == None:
+            print("msgpack isn't installed (pip3 install msgpack), falling back to JSON payloads.")
+            format = "json"
+
+        return PayloadCodec(format, config.get('decimals', None))
+
+    def encode(self, value):
+        if self.format == "msgpack":
+            return bytes([PayloadCodec.MSGPACK_V1]) + msgpack.packb(self.scale(value), use_bin_type=True)
+        return json.dumps(value)
+
+    # Replace floats with scaled integer extensions, using as few decimals as
+    # possible once rounded to our precision
+    def scale(self, value):
+        kind = type(value)
+        if kind is float:
+            return self.scaleFloat(value)
+        if kind is dict:
+            return {k: (self.scaleFloat(v) if type(v) is float else self.scale(v)) for (k, v) in value.items()}
+        if kind is list or kind is tuple:
+            return [self.scale(v) for v in value]
+        return value
+
+    def scaleFloat(self, value):
+        if value != value or value in (float('inf'), float('-inf')):
+            return value
+
+        decimals = self.decimals
+        raw = round(value * PayloadCodec.POWERS[decimals])
+        while decimals > 0 and raw % 10 == 0:
+            raw //= 10
+            decimals -= 1
+
+        # Extensions of 1, 2, 4 and 8 bytes have the most compact encoding
+        if -0x80 <= raw < 0x80:
+            length = 1
+        elif -0x8000 <= raw < 0x8000:
+            length = 2
+        elif -0x80000000 <= raw < 0x80000000:
+            length = 4
+        elif -0x8000000000000000 <= raw < 0x8000000000000000:
+            length = 8
+        else:
+            return value
+
+        return msgpack.ExtType(decimals, raw.to_bytes(length, "little", signed=True))
+
+    @staticmethod
+    def unscale(code, data):
+        if 0 <= code <= 9:
+            raw = int.from_bytes(data, "little", signed=True)
+            return raw / PayloadCodec.POWERS[code] if code > 0 else float(raw)
+        return msgpack.ExtType(code, data)
+
+    # Decode a payload, whichever codec produced it
+    @staticmethod
+    def decode(payload):
+        if isinstance(payload, str):
+            return json.loads(payload)
+
+        if len(payload) > 0 and payload[0] == PayloadCodec.MSGPACK_V1:
+            if msgpack == None:
+                raise ValueError("MessagePack payload received but msgpack isn't installed")
+            return msgpack.unpackb(payload[1:], ext_hook=PayloadCodec.unscale, raw=False)
+
+        return json.loads(payload)
+
+# Benchmark of the codecs, on a snapshot of all devices (as published on the
+# berrybms topic, ie captured with mosquitto_sub -t berrybms -C 1 > snapshot.json)
+# or on a synthetic one
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r") as f:
+            snapshot = json.load(f)
+    else:
+        snapshot = {}
+        for i in range(4):
+            bms = {f'CellVol{c}': (3300 + (i*16+c) % 23) * 0.001 for c in range(16)}
+            bms.update({"BatVol": 52.81, "BatCurrent": -12.345, "CellVolAve": 3.3010000000000001,
+                        "SOCStateOfcharge": 80, "SOCCapRemain": 224.123, "SOCFullChargeCap": 280.0,
+                        "SOCCycleCount": 12, "Alarms": 0, "name": f'jk{i}'})
+            snapshot[f'bms-{i}'] = bms
+        snapshot["xw-00000001"] = {"BatteryVoltage": 52.79, "BatteryCurrent": -30.123, "ChargeDCPower": 0,
+                                   "GridACInputPower": 0, "LoadACPowerApparent": 1570,
+                                   "GridInputEnergyToday": 0.0030000000000000001, "GridInputActiveToday": 0}
+        snapshot["mppt-00000002"] = {"PVVoltage": 301.2, "PVCurrent": 5.123, "PVPower": 1543,
+                                     "DCOutputPower": 1500, "PVInputActiveToday": 23456}
+
+    count = 10000
+    codecs = [("json", PayloadCodec("json"))]
+    if msgpack != None:
+        codecs.append(("msgpack", PayloadCodec("msgpack")))
+    else:
+        print("msgpack isn't installed, only benchmarking JSON")
+
+    for (name, codec) in codecs:
+        payload = codec.encode(snapshot)
+
+        start = time.perf_counter()
+        for i in range(count):
+            codec.encode(snapshot)
+        encode = (time.perf_counter() - start) / count
+
+        start = time.perf_counter()
+        for i in range(count):
+            PayloadCodec.decode(payload)
+        decode = (time.perf_counter() - start) / count
+
+        print(f"{name:8} {len(payload):6} bytes  encode {encode*1e6:7.1f}us  decode {decode*1e6:7.1f}us")
@@ -15,59 +15,116 @@ import pymodbus.exceptions # type: ignore
 import pymodbus.payload # type: ignore
 import time
 
+from ModbusPacer import ModbusPacer
+
+# Definition of a register. Definitions are immutable and shared by all
+# devices of the same class (see RegisterTable), values being kept in each
+# device's values dict.
 class Register(object):
 
+    __slots__ = ('name', 'address', 'type', 'scale', 'length', 'refresh')
+
+    # Refresh classes. Static registers are read once per connection (model,
+    # versions, etc.), slow ones change over minutes (energy counters, cycle
+    # count, settings) while fast ones (power, current, voltage) change all
+    # the time.
+    STATIC = 0
+    SLOW = 1
+    FAST = 2
+
+    # Minimum number of seconds between two reads of a register
+    refresh_intervals = {
+        SLOW: 60,
+        FAST: 5
+    }
+
     def __init__(self,
-            device,
             name,
             address,
             type,
             scale=1,
-            length=0
+            length=0,
+            refresh=FAST
             ):
-        
-        self.id = device.id
-        self.values = device.values
-        self.name = name
-        self.address = address
-        self.type = type
-        self.scale = scale
-        self.length = length
-        self.values[name] = None
-
-    def getValue(self, c, reload=False):
-
-        if reload == True:
-            self.values[self.name] = None
-
-        if self.values[self.name] != None:
-            return self.values[self.name]
-        
-        use_scale = True
-        if self.type == ModbusClientMixin.DATATYPE.STRING:
-            use_scale = False
-        elif (self.type == ModbusClientMixin.DATATYPE.INT16 or self.type == ModbusClientMixin.DATATYPE.UINT16):
-            self.length = 1
-        elif (self.type == ModbusClientMixin.DATATYPE.INT32 or self.type == ModbusClientMixin.DATATYPE.UINT32):
-            self.length = 2
-
-        recv = c.read_holding_registers(address=self.address, count=self.length, slave=self.id)
+
+        # We compute the length in registers upfront so that reads can be
+        # planned (see ModbusReadPlanner) before anything is fetched
+        if (type == ModbusClientMixin.DATATYPE.INT16 or type == ModbusClientMixin.DATATYPE.UINT16):
+            length = 1
+        elif (type == ModbusClientMixin.DATATYPE.INT32 or type == ModbusClientMixin.DATATYPE.UINT32):
+            length = 2
+
+        # Strings are never scaled
+        if type == ModbusClientMixin.DATATYPE.STRING:
+            scale = None
+
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'address', address)
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'scale', scale)
+        object.__setattr__(self, 'length', length)
+        object.__setattr__(self, 'refresh', refresh)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Register {self.name} is immutable")
+
+    @staticmethod
+    def configure(config):
+        if config == None:
+            return
+        Register.refresh_intervals[Register.SLOW] = config.get('slow', Register.refresh_intervals[Register.SLOW])
+        Register.refresh_intervals[Register.FAST] = config.get('fast', Register.refresh_intervals[Register.FAST])
+
+    # True if the register was never read on the device or if its
+    # refresh interval elapsed
+    def isDue(self, device, now):
+        last_read = device.last_read.get(self.name, None)
+        if last_read == None or device.values.get(self.name, None) == None:
+            return True
+        if self.refresh == Register.STATIC:
+            return False
+        return (now - last_read) >= Register.refresh_intervals[self.refresh]
+
+    def getValue(self, device, reload=False):
+
+        if reload == False and device.values.get(self.name, None) != None:
+            return device.values[self.name]
+
+        c = device.connection
+        recv = ModbusPacer.forConnection(c).execute(device.id, c.read_holding_registers, address=self.address, count=self.length)
         if not isinstance(recv, pymodbus.pdu.register_message.ReadHoldingRegistersResponse):
             return None
 
-        self.values[self.name] = c.convert_from_registers(recv.registers, data_type=self.type)
-        if use_scale:
-            self.values[self.name] = self.values[self.name] * self.scale
-  
-        time.sleep(0.05)
+        return self.decode(device, recv.registers)
+
+    # Same as getValue() but through a ModbusTcpPipeline, from a coroutine
+    async def getValueAsync(self, device, pipeline, reload=False):
+
+        if reload == False and device.values.get(self.name, None) != None:
+            return device.values[self.name]
+
+        (registers, exception_code) = await pipeline.readHoldingRegisters(device.id, self.address, self.length)
+        if registers == None:
+            return None
+
+        return self.decode(device, registers)
+
+    # Decode the device's value from raw registers, which may come from a
+    # single read or from a slice of a larger block read
+    def decode(self, device, registers):
+        value = ModbusClientMixin.convert_from_registers(registers, data_type=self.type)
+        if self.scale != None:
+            value = value * self.scale
 
-        return self.values[self.name]
+        device.values[self.name] = value
+        device.last_read[self.name] = time.monotonic()
+        return value
 
-    def setValue(self, c, value):
+    def setValue(self, device, value):
 
-        self.values[self.name] = value
+        c = device.connection
+        device.values[self.name] = value
         raw_value = c.convert_to_registers(value, self.type)
-        r = c.write_registers(self.address, raw_value, slave=self.id)
-        time.sleep(0.05)
+        r = ModbusPacer.forConnection(c).execute(device.id, c.write_registers, self.address, raw_value)
 
         return r
@@ -0,0 +1,34 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+
+# Register definitions of a device class, compiled once when the class is
+# defined and shared by all its devices. Registers are indexed by name for
+# constant time lookups.
+class RegisterTable(object):
+
+    __slots__ = ('registers', 'index')
+
+    def __init__(self, registers):
+        registers = tuple(registers)
+        object.__setattr__(self, 'registers', registers)
+        object.__setattr__(self, 'index', dict((register.name, register) for register in registers))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RegisterTable is immutable")
+
+    def __iter__(self):
+        return iter(self.registers)
+
+    def __len__(self):
+        return len(self.registers)
+
+    def get(self, name):
+        return self.index.get(name, None)
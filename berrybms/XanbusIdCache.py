@@ -0,0 +1,88 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import collections
+import random
+import sys
+import time
+
+from Nmea2000 import Iso11783Decode
+from XanbusMessage import XanbusMessage
+
+# Decoded arbitration id, shared by all the frames carrying it
+XanbusId = collections.namedtuple("XanbusId", ["pgn", "src", "dst", "pri", "is_fast_packet", "is_handled", "is_ignored"])
+
+# Cache of decoded arbitration ids. A Xanbus network only uses a few dozen
+# of them so, once seen, decoding one is a dict lookup returning the same
+# immutable record. The cache is bounded in case we get garbage from the bus,
+# the oldest ids being forgotten first.
+class XanbusIdCache(object):
+
+    MAX_IDS = 1024
+
+    def __init__(self,
+                 registry=None,
+                 max_ids=None):
+        self.registry = registry
+        self.max_ids = XanbusIdCache.MAX_IDS if max_ids == None else max_ids
+        self.ids = dict()
+        self.misses = 0
+
+    def decode(self, arbitration_id):
+        xanbus_id = self.ids.get(arbitration_id, None)
+        if xanbus_id == None:
+            xanbus_id = self.miss(arbitration_id)
+        return xanbus_id
+
+    def miss(self, arbitration_id):
+        self.misses += 1
+        (pgn, src, dst, pri) = Iso11783Decode(arbitration_id)
+        is_handled = False
+        is_ignored = False
+        if self.registry != None:
+            is_handled = self.registry.handles(pgn)
+            is_ignored = self.registry.ignores(pgn)
+        xanbus_id = XanbusId(pgn, src, dst, pri, pgn in XanbusMessage.xanbus_fast_packets, is_handled, is_ignored)
+
+        # dicts keep their insertion order, the first key is the oldest one
+        if len(self.ids) >= self.max_ids:
+            del self.ids[next(iter(self.ids))]
+        self.ids[arbitration_id] = xanbus_id
+        return xanbus_id
+
+# Benchmark of the arbitration id decoding, on a trace recorded with
+# candump -l (or any format python-can reads) or on a synthetic one
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        import can # type: ignore
+        arbitration_ids = [message.arbitration_id for message in can.LogReader(sys.argv[1]) if message.is_extended_id]
+    else:
+        from Nmea2000 import Iso11783Encode
+        pgns = [0x1F016, 0x1F0BD, 0x1F0C5, 0x1F0C4, 0x1F0C6, 0x1F00E, 0x1F01B, 0x1F011, 0x1F809, 0x1F00F, 0x1F01D, 0xEE00]
+        known = [Iso11783Encode(pgn, src, 0xFF, 6) for pgn in pgns for src in (0, 1, 2, 3)]
+        arbitration_ids = [random.choice(known) for i in range(200000)]
+
+    fast_packets = XanbusMessage.xanbus_fast_packets
+    start = time.perf_counter()
+    for arbitration_id in arbitration_ids:
+        (pgn, src, dst, pri) = Iso11783Decode(arbitration_id)
+        is_fast_packet = pgn in fast_packets
+    direct = (time.perf_counter() - start) / len(arbitration_ids)
+
+    cache = XanbusIdCache()
+    start = time.perf_counter()
+    for arbitration_id in arbitration_ids:
+        xanbus_id = cache.decode(arbitration_id)
+        is_fast_packet = xanbus_id.is_fast_packet
+    cached = (time.perf_counter() - start) / len(arbitration_ids)
+
+    print(f"{len(arbitration_ids)} frames, {len(cache.ids)} arbitration ids")
+    print(f"Iso11783Decode {direct*1e9:6.0f}ns/frame")
+    print(f"XanbusIdCache  {cached*1e9:6.0f}ns/frame")
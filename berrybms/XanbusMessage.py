@@ -24,11 +24,16 @@ class XanbusMessage(object):
         0x1F80E, # SwVerSts
     }
 
+    # Largest number of bytes a fast packet can carry: 6 in the first frame
+    # and 7 in each of the 31 following ones
+    MAX_LENGTH = 223
+
     def __init__(self,
                   pgn,
                   src,
                   dst,
-                  pri):
+                  pri,
+                  is_fast_packet=None):
           
           self.pgn = pgn
           self.src = src
@@ -36,49 +41,73 @@ class XanbusMessage(object):
           self.pri = pri
 
           self.data = None
-          self.is_fast_packet = (self.pgn in self.xanbus_fast_packets)
+          if is_fast_packet == None:
+              is_fast_packet = (self.pgn in self.xanbus_fast_packets)
+          self.is_fast_packet = is_fast_packet
           self.is_ready = (not self.is_fast_packet)
           self.sequence_id = 0
           self.total_length = 0
+          self.frames = 0
           self.is_bogus = False
+          # Why the message was found to be bogus
+          self.error = None
+
+    def bogus(self, error):
+        self.is_bogus = True
+        self.error = error
+        return None
 
-    def append_bytes(self, message):
+    # Append the data of a CAN frame to the message. Returns the message once
+    # it is complete, None otherwise.
+    def append_bytes(self, data):
         if self.is_fast_packet:
             # https://www.csselectronics.com/pages/nmea-2000-n2k-intro-tutorial#fast-packet
-            first_byte = int.from_bytes(message.data[:1])
-            sequence_id = first_byte >> 4 # first nibble
-            frame_id = first_byte & 0x0F  # second nibble
+            # The first byte holds a 3 bits sequence counter, identifying the
+            # message, and a 5 bits frame counter
+            first_byte = data[0]
+            sequence_id = first_byte >> 5
+            frame_id = first_byte & 0x1F
             #print(f'{first_byte:b} {first_byte:x} {sequence_id} {frame_id}')
 
-            if frame_id == 0 and self.data == None:
+            if self.data == None:
+                if frame_id != 0:
+                    # We started listening in the middle of the message
+                    return self.bogus("orphan")
+
                 self.sequence_id = sequence_id
-                self.total_length = int.from_bytes(message.data[1:2])
+                self.total_length = data[1]
                 #print(f"TOTAL LENGTH TO READ: {self.total_length} sequence_id={sequence_id} pgn={self.pgn:x}")
-                if self.total_length == 0:
-                    self.is_bogus = True
-                    return
-                self.data = bytearray(message.data[2:])
+                if self.total_length == 0 or self.total_length > XanbusMessage.MAX_LENGTH:
+                    return self.bogus("length")
+
+                # Frames are always 8 bytes long, the last one being padded. We keep
+                # that padding as the decoders expect it.
+                self.data = bytearray(6 + 7*(self.total_length // 7))
+                chunk = data[2:8]
+                self.data[0:len(chunk)] = chunk
+                self.frames = 1
             else:
-                if self.data == None:
-                    #print(f"GOT ANOTHER FAST PACKET BUT NOT THE FIRST ONE pgn: {self.pgn:x} - cur: {self.sequence_id}  got: {sequence_id}  -- IGNORING FOR NOW")
-                    self.is_bogus = True
-                    return
+                if sequence_id != self.sequence_id:
+                    return self.bogus("sequence")
 
-                # Disabled for now, that won't work for PGN 1f0be since it'll send packets that are larger
-                # than 16 chunks
-                #if self.sequence_id != sequence_id:
-                #    print(f"GOT OUT OF SEQUENCE PACKET pgn: {self.pgn:x} - cur: {self.sequence_id}  got: {sequence_id}  -- IGNORING FOR NOW")
-                #    self.is_bogus = True
-                #    return
+                # The frame counter wraps around after 31
+                if frame_id != (self.frames & 0x1F):
+                    return self.bogus("gap")
 
-                data_to_append = message.data[1:]
-                self.data += data_to_append
+                offset = 6 + 7*(self.frames - 1)
+                chunk = data[1:8]
+                self.data[offset:offset+len(chunk)] = chunk
+                self.frames += 1
 
-                # Message ready to be processed
-                if len(self.data) >= self.total_length:
-                    self.is_ready = True
+            # Message ready to be processed
+            if 6 + 7*(self.frames - 1) >= self.total_length:
+                self.is_ready = True
         else:
-            self.data = message.data
+            self.data = data
+
+        if self.is_ready:
+            return self
+        return None
     
     def bytes(self):
-        return self.data
\ No newline at end of file
+        return self.data
@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import struct
+import time
+
+# PGN to handler table for Xanbus messages. Each handler comes with the
+# struct.Struct decoding the fields it needs, compiled once when registered,
+# and is called as handler(src, buffer, decoder). PGNs we know about but
+# don't care for are registered as ignored so that their frames can be
+# dropped as soon as they are received.
+class XanbusPgnRegistry(object):
+
+    def __init__(self):
+        self.handlers = dict()
+        self.ignored = set()
+        # Per PGN [decoded, seconds spent decoding] counters
+        self.stats = dict()
+
+    def register(self, pgn, handler, format=None):
+        decoder = None
+        if format != None:
+            decoder = struct.Struct(format)
+        self.handlers[pgn] = (handler, decoder)
+
+    def ignore(self, pgn):
+        self.ignored.add(pgn)
+
+    def ignores(self, pgn):
+        return pgn in self.ignored
+
+    def handles(self, pgn):
+        return pgn in self.handlers
+
+    # Call the handler of a message's PGN. Returns False if there is none.
+    def dispatch(self, pgn, src, buffer):
+        entry = self.handlers.get(pgn, None)
+        if entry == None:
+            return False
+
+        (handler, decoder) = entry
+        start = time.perf_counter()
+        try:
+            handler(src, buffer, decoder)
+        finally:
+            elapsed = time.perf_counter() - start
+            counters = self.stats.get(pgn, None)
+            if counters == None:
+                counters = [0, 0.0]
+                self.stats[pgn] = counters
+            counters[0] += 1
+            counters[1] += elapsed
+        return True
+
+    # Acceptance filter (as python-can expects them) matching all frames of a
+    # PGN, whatever their source. PDU1 PGNs (PF < 240) carry their destination
+    # in the PS byte, which is left out of the mask.
+    @staticmethod
+    def canFilter(pgn):
+        if ((pgn >> 8) & 0xFF) > 239:
+            return {"can_id": (pgn & 0x3FFFF) << 8, "can_mask": 0x03FFFF00, "extended": True}
+        return {"can_id": (pgn & 0x3FF00) << 8, "can_mask": 0x03FF0000, "extended": True}
+
+    # Filters accepting the frames of the PGNs we have a handler for
+    def canFilters(self, exclude=()):
+        return [XanbusPgnRegistry.canFilter(pgn) for pgn in sorted(self.handlers.keys()) if pgn not in exclude]
+
+    # Total of decoded messages and seconds spent decoding them
+    def totals(self):
+        decoded = 0
+        seconds = 0.0
+        for (count, elapsed) in self.stats.values():
+            decoded += count
+            seconds += elapsed
+        return (decoded, seconds)
+
+    # One line per PGN, most expensive first
+    def report(self):
+        lines = []
+        for (pgn, (count, elapsed)) in sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True):
+            (handler, decoder) = self.handlers[pgn]
+            lines.append(f"{pgn:05X} {handler.__name__:20} {count:8} decoded {elapsed*1e6/count:8.1f}us/message")
+        return lines
@@ -0,0 +1,123 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import heapq
+
+from XanbusMessage import XanbusMessage
+
+# Reassembly of the Xanbus (NMEA 2000) messages from CAN frames. Single
+# frame messages are returned right away, fast packets once their last frame
+# is received. Partial fast packets are discarded when their deadline passes
+# or, when too many bytes are buffered, oldest first.
+class XanbusReassembler(object):
+
+    # Seconds after which a partially received fast packet is discarded
+    TIMEOUT = 1.0
+
+    # Bytes which can be buffered for partial fast packets
+    MAX_BUFFERED = 16384
+
+    def __init__(self,
+                 timeout=None,
+                 max_buffered=None):
+        self.timeout = XanbusReassembler.TIMEOUT if timeout == None else timeout
+        self.max_buffered = XanbusReassembler.MAX_BUFFERED if max_buffered == None else max_buffered
+        self.messages = dict()
+        # (deadline, counter, arbitration id, message) of partial messages
+        self.deadlines = []
+        self.counter = 0
+        self.buffered = 0
+        # Per PGN [completed, dropped, timed out] counters
+        self.stats = dict()
+
+    def count(self, pgn, index):
+        counters = self.stats.get(pgn, None)
+        if counters == None:
+            counters = [0, 0, 0]
+            self.stats[pgn] = counters
+        counters[index] += 1
+
+    def remove(self, arbitration_id):
+        message = self.messages.pop(arbitration_id)
+        if message.data != None:
+            self.buffered -= len(message.data)
+        return message
+
+    # Add the data of a CAN frame (with its already decoded arbitration id),
+    # returning the message it completes, if any
+    def append(self, arbitration_id, data, pgn, src, dst, pri, now, is_fast_packet=None):
+        xanbus_message = self.messages.get(arbitration_id, None)
+
+        # A first frame while we're still waiting for the end of a message means
+        # the rest of that message was lost
+        if xanbus_message != None and xanbus_message.is_fast_packet and len(data) > 0 and (data[0] & 0x1F) == 0:
+            self.remove(arbitration_id)
+            self.count(pgn, 1)
+            xanbus_message = None
+
+        if xanbus_message == None:
+            xanbus_message = XanbusMessage(pgn,src,dst,pri,is_fast_packet)
+            if xanbus_message.is_fast_packet:
+                self.messages[arbitration_id] = xanbus_message
+
+        if len(data) == 0:
+            xanbus_message.bogus("length")
+            ready_message = None
+        else:
+            was_empty = (xanbus_message.data == None)
+            ready_message = xanbus_message.append_bytes(data)
+            if xanbus_message.is_fast_packet and was_empty and xanbus_message.data != None:
+                self.buffered += len(xanbus_message.data)
+                self.counter += 1
+                heapq.heappush(self.deadlines, (now + self.timeout, self.counter, arbitration_id, xanbus_message))
+
+        if xanbus_message.is_bogus:
+            if xanbus_message.is_fast_packet:
+                self.remove(arbitration_id)
+            # Frames following a dropped message (or received before we saw the
+            # start of one) aren't counted again
+            if xanbus_message.error != "orphan":
+                self.count(pgn, 1)
+            return None
+
+        if ready_message != None:
+            if ready_message.is_fast_packet:
+                self.remove(arbitration_id)
+            self.count(pgn, 0)
+            return ready_message
+
+        if self.buffered > self.max_buffered:
+            self.evict(now)
+        return None
+
+    # Discard partial messages whose deadline passed. Messages completed (or
+    # replaced) in the meantime are simply skipped.
+    def expire(self, now):
+        while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+            (deadline, counter, arbitration_id, xanbus_message) = heapq.heappop(self.deadlines)
+            if self.messages.get(arbitration_id, None) is xanbus_message:
+                self.remove(arbitration_id)
+                self.count(xanbus_message.pgn, 2)
+
+    # Discard the oldest partial messages until we are back under our limit
+    def evict(self, now):
+        while self.buffered > self.max_buffered and len(self.deadlines) > 0:
+            (deadline, counter, arbitration_id, xanbus_message) = heapq.heappop(self.deadlines)
+            if self.messages.get(arbitration_id, None) is xanbus_message:
+                self.remove(arbitration_id)
+                self.count(xanbus_message.pgn, 1)
+
+    # Total of completed, dropped and timed out messages
+    def totals(self):
+        totals = [0, 0, 0]
+        for counters in self.stats.values():
+            for i in range(3):
+                totals[i] += counters[i]
+        return totals
@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import collections
+import threading
+
+# Thread draining a CAN bus into a bounded queue of (timestamp, arbitration
+# id, data) tuples, so that frames keep being read while the consumer is busy
+# (ie, publishing to a slow MQTT broker). The queue is a deque, whose append()
+# and popleft() are atomic, the event only being used to wake up an idle
+# consumer. When the queue is full, either the oldest or the newest frames
+# are dropped, depending on the policy. Frames can also be recorded as they
+# are received (see XanbusTrace).
+class XanbusReceiver(object):
+
+    QUEUE_SIZE = 4096
+
+    DROP_OLDEST = "oldest"
+    DROP_NEWEST = "newest"
+
+    # Seconds we wait for a frame before checking if we must stop
+    RECV_TIMEOUT = 0.5
+
+    def __init__(self,
+                 bus,
+                 size=None,
+                 policy=None,
+                 trace=None):
+        self.bus = bus
+        self.trace = trace
+        self.size = XanbusReceiver.QUEUE_SIZE if size == None else int(size)
+        self.policy = XanbusReceiver.DROP_OLDEST if policy == None else policy
+        if self.policy not in (XanbusReceiver.DROP_OLDEST, XanbusReceiver.DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy {self.policy}, must be {XanbusReceiver.DROP_OLDEST} or {XanbusReceiver.DROP_NEWEST}")
+
+        # With drop oldest, the deque discards the oldest frame by itself
+        if self.policy == XanbusReceiver.DROP_OLDEST:
+            self.queue = collections.deque(maxlen=self.size)
+        else:
+            self.queue = collections.deque()
+        self.ready = threading.Event()
+        self.thread = None
+        self.must_stop = False
+        # Set once no more frames will come (ie, at the end of a replay)
+        self.done = False
+
+        self.received = 0
+        self.dropped = 0
+        # Largest queue depth, overall and since it was last reported
+        self.high_water = 0
+        self.recent_high_water = 0
+
+    @staticmethod
+    def fromConfig(bus, config, trace=None):
+        return XanbusReceiver(bus, config.get('queue_size', None), config.get('drop_policy', None), trace)
+
+    def start(self):
+        self.must_stop = False
+        self.thread = threading.Thread(target=self.run, name="XanbusReceiver", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.must_stop = True
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        bus = self.bus
+        queue = self.queue
+        size = self.size
+        drop_newest = (self.policy == XanbusReceiver.DROP_NEWEST)
+        trace = self.trace
+
+        while not self.must_stop:
+            message = bus.recv(XanbusReceiver.RECV_TIMEOUT)
+            if message == None:
+                continue
+
+            self.received += 1
+            if trace != None:
+                trace.write(message)
+
+            depth = len(queue)
+            if depth >= size:
+                self.dropped += 1
+                if drop_newest:
+                    continue
+            else:
+                depth += 1
+
+            queue.append((message.timestamp, message.arbitration_id, message.data))
+            if depth > self.recent_high_water:
+                self.recent_high_water = depth
+                if depth > self.high_water:
+                    self.high_water = depth
+
+            if not self.ready.is_set():
+                self.ready.set()
+
+    # Next frame, waiting at most timeout seconds for one. Returns None if
+    # there is none.
+    def get(self, timeout):
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            pass
+
+        # Cleared before checking the queue again, so a frame queued in
+        # between can't be missed
+        self.ready.clear()
+        if len(self.queue) == 0:
+            self.ready.wait(timeout)
+
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            return None
+
+    def statistics(self):
+        recent_high_water = self.recent_high_water
+        self.recent_high_water = len(self.queue)
+        return f"CAN queue: {len(self.queue)}/{self.size} queued, high water {recent_high_water} ({self.high_water} overall), {self.dropped} dropped (drop {self.policy})"
@@ -0,0 +1,72 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import time
+
+from XanbusReceiver import XanbusReceiver
+from XanbusTrace import XanbusTrace
+
+# Source of frames reading a recording (see XanbusTrace) instead of the bus,
+# for the sniffer to process frames exactly as if they were just received.
+# Frames are replayed as fast as they are consumed or, in realtime, spaced as
+# they were recorded. Frames are timestamped with the time they are replayed
+# at, so that latencies can be measured the same way as with the bus.
+class XanbusReplay(XanbusReceiver):
+
+    def __init__(self,
+                 path,
+                 realtime=False):
+        super().__init__(None)
+        self.path = path
+        self.realtime = realtime
+        self.frames = None
+        # Frame read from the trace but not yet due
+        self.pending = None
+        self.started_at = 0
+        self.first_timestamp = None
+
+    def start(self):
+        self.frames = XanbusTrace.read(self.path)
+        self.started_at = time.time()
+
+    def stop(self):
+        if self.frames != None:
+            self.frames.close()
+            self.frames = None
+
+    def get(self, timeout):
+        if self.pending == None:
+            try:
+                self.pending = next(self.frames)
+            except StopIteration:
+                self.done = True
+                return None
+            self.received += 1
+
+        (timestamp, arbitration_id, data) = self.pending
+        if not self.realtime:
+            self.pending = None
+            return (time.time(), arbitration_id, data)
+
+        if self.first_timestamp == None:
+            self.first_timestamp = timestamp
+        due = self.started_at + (timestamp - self.first_timestamp)
+        delay = due - time.time()
+        if delay > timeout:
+            time.sleep(timeout)
+            return None
+        if delay > 0:
+            time.sleep(delay)
+
+        self.pending = None
+        return (due, arbitration_id, data)
+
+    def statistics(self):
+        return f"Replay: {self.received} frames read from {self.path}"
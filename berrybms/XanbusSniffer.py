@@ -10,14 +10,11 @@
 #
 import can # type: ignore
 import binascii
-import struct
 import time
 import sys
 import logging
 import socket
 
-import paho.mqtt.client as paho # type: ignore
-import json
 import yaml # type: ignore
 
 from ConextAGS import ConextAGS
@@ -27,30 +24,158 @@ from ConextMPPT import ConextMPPT
 from ConextSCP import ConextSCP # type: ignore
 from ConextXW import ConextXW
 
-from Nmea2000 import Iso11783Decode, Iso11783Encode
-from XanbusMessage import XanbusMessage
+from MqttPublisher import MqttPublisher
+from Nmea2000 import Iso11783Encode
+from XanbusIdCache import XanbusIdCache
+from XanbusPgnRegistry import XanbusPgnRegistry
+from XanbusReassembler import XanbusReassembler
+from XanbusReceiver import XanbusReceiver
+from XanbusReplay import XanbusReplay
+from XanbusTrace import XanbusTrace
 
 class XanbusSniffer(object):
 
+    # Replies to our discovery requests (ProdInfoSts, HwRevSts)
+    DISCOVERY_PGNS = {0x1F014, 0x1F810}
+
+    # Seconds during which discovery replies are accepted after a request
+    DISCOVERY_WINDOW = 10
+
     def __init__(self,
                 config,
-                logger):
+                logger,
+                publisher=None):
             
         self.config = config
         self.logger = logger
         self.all_xanbus_devices = dict()
         self.unknown_bytes = bytearray()
-        self.xanbus_queue = dict()
+        self.reassembler = XanbusReassembler()
         self.must_stop = False
-    
-    def processBattMonSts(self, src, bytes):
+        self.publisher = publisher
+        self.registry = XanbusPgnRegistry()
+        self.registerHandlers()
+        self.ids = XanbusIdCache(self.registry)
+        # Frames of the PGNs we don't handle are rejected by the kernel (or by
+        # python-can with socketcand) unless filters are disabled
+        self.filtering = config['conext']['xanbus_sniffer'].get('filters', True)
+        self.discovering = False
+        self.discovery_deadline = 0
+        self.receiver = None
+        # Seconds between the reception of the last frame of a message and the
+        # end of its processing
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    # Formats only decode the fields the handlers use, other ones being skipped
+    # with pad bytes
+    def registerHandlers(self):
+        registry = self.registry
+
+        # XW+ / AcStsRms (assoc, p11, p15, pad28)
+        # Collides with standardized "PGN: 126998 - Configuration Information"
+        registry.register(0x1F016, self.processAcStsRms, '<xB16xhxxh19xh')
+
+        # XW+ / InvSts2  (inverter status?)
+        registry.register(0x1F0BD, self.processInvSts2, '<xBHxB')
+
+        # XW+/MPPT / DcSrcSts2
+        registry.register(0x1F0C5, self.processDcSrcSts2, '<xBIii')
+
+        # XW+/MPPT / BattSts2
+        registry.register(0x1F0C4, self.processBattSts2, '<2xIii')
+
+        # XW+/MPPT / SpsSts
+        # Sps == {sensor,secondary} power supply? // Smart Production Solution?
+        # same data over and over?
+        registry.register(0x1F0C6, self.processSpsSts)
+
+        # XW+/MPPT / ChgSts -- charger status
+        # First value is 56400 which looks like 56.4v
+        registry.register(0x1F00E, self.processChgSts, '<11xBHB')
+
+        # BattMon / BattMonSts
+        registry.register(0x1F01B, self.processBattMonSts, '<2xIi2xHHb')
+
+        # AGS / AgsSts
+        registry.register(0x1F011, self.processAgsSts, '<4xBBB')
+
+        # SCP/XW+/InsightHome(src==6) / DateTimeSts
+        # Non-standard date-format
+        registry.register(0x1F809, self.processDateTimeSts, '<xIh')
+
+        registry.register(0x1F014, self.processProdInfoSts)
+        registry.register(0x1F810, self.processHwRevSts)
+        registry.register(0x1F80E, self.processSwVerSts)
+
+        #
+        # UNDOCUMENTED STUFF
+        #
+
+        # MPPT data - looks like data produced per hour/day/week...
+        # No data is being sent by the XW+ even the generator is on
+        registry.register(0x1F0BE, self.processUnknown2, '<50xI23xI')
+
+        # Sent by XW6848 Pro only
+        registry.register(0x1DC00, self.processUnknown3, '<B')
+
+        #
+        # Ignored, their frames being dropped before reassembly
+        #
+
+        # ALL / Sts -- status?
+        registry.ignore(0x1F00F)
+
+        # XW+ / AcXferSwSts (useless?)
+        # 03 20 03 01 -- gen off
+        # 03 22 03 02 -- when gen is on
+        registry.ignore(0x1F0BF)
+
+        # coming only from MPPT?
+        # Single packet, weird sequence over and over
+        # 2nd by changes, but 3rd and 4th are relatively static
+        registry.ignore(0x1F00D)
+
+        # coming from XW only?
+        # weird sequence, over and over
+        # no data received when gen is on?!?
+        registry.ignore(0x1F01D)
+
+        # coming from MPPT? - looks like we get 0301 all the time
+        # maybe just status info
+        registry.ignore(0x1F0C9)
+
+        # src == 0 - that's the SCP
+        # We get 030105 all the time, also maybe just status info
+        registry.ignore(0x1F01C)
+
+        # unknown: 75008 1 0 Timestamp: 1737842977.896904    ID: 19250001    X Rx                DL:  4    10 00 83 03                 Channel: can0
+        # unknown: 75008 1 0 Timestamp: 1737842977.906757    ID: 19250001    X Rx                DL:  4    10 00 85 13                 Channel: can0
+        # unknown: 75008 1 0 Timestamp: 1737842977.916757    ID: 19250001    X Rx                DL:  4    10 00 86 33                 Channel: can0
+        # unknown: 75008 1 0 Timestamp: 1737842977.926593    ID: 19250001    X Rx                DL:  4    10 00 87 43                 Channel: can0
+        # AssocCfg
+        registry.ignore(0x12500)
+
+        # STD: ISO Acknowledgement
+        # 59392
+        registry.ignore(0xE800)
+
+        # STD: ISO Request
+        # 59904 0 3 Timestamp: 1737842084.946513    ID: 18ea0300    X Rx                DL:  3    be f0 01                    Channel: can0
+        # See https://www.csselectronics.com/pages/j1939-explained-simple-intro-tutorial#j1939-request-messages for an excellent documentation
+        registry.ignore(0xEA00)
+
+        # STD: ISO Address Claim
+        registry.ignore(0xEE00)
+
+    def processBattMonSts(self, src, bytes, decoder):
         # TODO: decode voltage midpoints and remaining data
         # b'0303 d6d30000 f4640100 6874 9500 2f04 58 ff 8504 fffffffffffcff0000000000000000ffffff7fffff'
         #print(f'ConextBattMonStats: src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         
-        f ='<BBIiHHHbbH21x'
-        fields = struct.unpack(f, bytes)
-        (status,assoc,voltage,current,battery_temperature,capacity_removed,capacity_remaining,soc,pad6,time_to_discharge) = fields
+        # (status,assoc,voltage,current,battery_temperature,capacity_removed,capacity_remaining,soc,pad6,time_to_discharge) = '<BBIiHHHbbH21x'
+        (voltage,current,capacity_removed,capacity_remaining,soc) = decoder.unpack_from(bytes)
 
         #print(f'src={src} BATTMON voltage={voltage/1000}v current={current/1000}A battery_temperature={battery_temperature/1000}C capacity_removed={capacity_removed}Ah capacity_remaining={capacity_remaining}Ah soc={soc}% time_to_discharge={time_to_discharge}mins')
         #print(f'{pad1:x} {pad2:x} {pad3:x} {pad6:x}')
@@ -63,20 +188,19 @@ class XanbusSniffer(object):
         battmon.values["BatterySOC"] = soc
 
     # Shared with XW+/MPPT
-    def processBattSts2(self, src, bytes):
+    def processBattSts2(self, src, bytes, decoder):
         #print(f'{processBattSts2.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # MPPT: b'0303 90d30000 98710000 26060000 ffff ffff 00ff ff41 ffffffffffffffffffffffff0330ffffffffff'
         # XW:   b'0303 f0d20000 9cebffff 19010000 ffff ffff 00ff ff56 ffffffffffffffffffffffffffffffffffffff'
-        (status,assoc,voltage,current,power) = struct.unpack('<BBIii27x', bytes)
+        (voltage,current,power) = decoder.unpack_from(bytes)
         #print(f'src={src} DC USAGE: voltage={voltage/1000}v current={current/1000}A power={power}W')
 
-    def processAcStsRms(self, src, bytes):
+    def processAcStsRms(self, src, bytes, decoder):
         # assoc == 13  -> AC2 in
         # assoc == 33  -> AC Out/Loads
         # assoc == 43  -> AC1 in/out (grid)
-        status = int(bytes[0])
-        assoc = int(bytes[1])
         xw = self.all_xanbus_devices[src]
+        (assoc,p11,p15,pad28) = decoder.unpack_from(bytes)
 
         if len(bytes) == 55:
             #print(f'assoc = {assoc}')
@@ -92,8 +216,8 @@ class XanbusSniffer(object):
                 # b'03 33 fc 01 ff 42d50100   c206        00 00 05 7017 ffff f900 00 00 f900 00 00 03 7f 02 ff 42d50100      cc06        00 00 05 7017   ffff  2301  0000 2301 0000 04 7fffff'
                 #                  LOAD_V_LN1 LOAD_I_LN1           GF1  GF2  p11        p15                    LOAD_V_LN_2   LOAD_I_LN2           LOAD_F AC2_F pad28      pad30
                 #   B  B  B  B  B  I          h           B  B  B  h    h    h     B  B  h     B  B  B  B  B  B  I             h           B  B  B  h      h     H     h    H
-                (status,assoc,p1,p2,p3,load_v_ln1,load_i_ln1,p4,p5,p6,gen1_f,gen2_f,p11,p13,p14,p15,p17,p18,p19,p20,p21,p22,load_v_ln2,load_i_ln2,p25,p26,p27,load_f,ac2_f,pad28,pad29,pad30) = struct.unpack('<5BIh1BBBhhhBBh6BIhBBBhhhhH6x', bytes)
-                load_i = load_i_ln1+load_i_ln2
+                # (status,assoc,p1,p2,p3,load_v_ln1,load_i_ln1,p4,p5,p6,gen1_f,gen2_f,p11,p13,p14,p15,p17,p18,p19,p20,p21,p22,load_v_ln2,load_i_ln2,p25,p26,p27,load_f,ac2_f,pad28,pad29,pad30) = '<5BIh1BBBhhhBBh6BIhBBBhhhhH6x'
+                #load_i = load_i_ln1+load_i_ln2
 
                 load_p = p11+pad28
 
@@ -107,7 +231,7 @@ class XanbusSniffer(object):
                 #print(f'src={src} load_v_ln1={load_v_ln1/1000}v load_i_ln1={load_i_ln1/1000}A load_v_ln2={load_v_ln2/1000}v load_i_ln2={load_i_ln2/1000}A load_f={load_f} ac2_f={ac2_f} load_i={load_i/1000}A load_p={load_p:.0f}W p11={p11} p15={p15} pad28={pad28} pad29={pad30}')
                 #if assoc == 0x13:
                 #    sys.exit(0)
-        else:
+        elif len(bytes) == 83:
             #print(f'{processAcStsRms.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
             # 83 bytes, ASSOC_CFG_AC_INPUT_response
             #b'03 43 fc 01 01 0000000000000000ff000070170000000000000000ff7f02010000000000000000ff000070170000000000000000ff7f030100000000ffffff7fff00007017ffffffffffffffffff7fffffffffff'
@@ -116,17 +240,15 @@ class XanbusSniffer(object):
             #                 LOAD_V_LN1 LOAD_I_LN1           GF1  GF2  p11        p15                    LOAD_V_LN_2   LOAD_I_LN2           LOAD_F AC2_F pad28      pad30               extra bytes from ac1 (grid)
             #b'03 43 fc 01 04 40d70100   5083        ff ff ff 9417 7017 e9f0 ff ff eaf0 ff ff ff 7f 02 04 80d80100      9a89        ff ff ff 9417   7017  adf1  ffff 75f1 ffff ff 7f0304 12b80300ffffff7fff94177017ffffffffffffffffff7fffffffffff' -- grid on (or gen2)
             #(state,assoc) = struct.unpack('<BB81x', bytes)
-            buffer1 = bytes[0:55]
-
-            (status,assoc,p1,p2,p3,ac1_in_v_ln1,ac1_i_ln1,p4,p5,p6,gen1_f,gen2_f,p11,p13,p14,p15,p17,p18,p19,p20,p21,p22,ac1_in_v_ln2,ac1_i_ln2,p25,p26,p27,load_f,ac2_f,pad28,pad29,pad30) = struct.unpack('<5BIh1BBBhhhBBh6BIhBBBhhhhH6x', buffer1)
-            ac1_in_i = ac1_i_ln1+ac1_i_ln2
+            # The first 55 bytes are laid out as above
+            # (status,assoc,p1,p2,p3,ac1_in_v_ln1,ac1_i_ln1,p4,p5,p6,gen1_f,gen2_f,p11,p13,p14,p15,p17,p18,p19,p20,p21,p22,ac1_in_v_ln2,ac1_i_ln2,p25,p26,p27,load_f,ac2_f,pad28,pad29,pad30) = '<5BIh1BBBhhhBBh6BIhBBBhhhhH6x'
+            #ac1_in_i = ac1_i_ln1+ac1_i_ln2
             ac1_in_p = p11+p15
 
             xw.values["GridACInputPower"] = ac1_in_p
 
             # 12b80300 ff ff ff 7f ff 9417 7017 ffffffffffffffffff7fffffffffff  (remaining part, 28 bytes)
-            buffer2 = bytes[55:83]
-            (load_v,pad,pad,pad,pad,pad,ac1_in_f,acX_in_f) = struct.unpack('<IBBBBBhh15x', buffer2)
+            # (load_v,pad,pad,pad,pad,pad,ac1_in_f,acX_in_f) = '<IBBBBBhh15x'
 
             #print(f'gen1_f={gen1_f} gen2_f={gen2_f}') # gen1_f == load_f == ac1_in_f
             #print(f'src={src} ac1_in_v_ln1={ac1_in_v_ln1/1000}v ac1_i_ln1={ac1_i_ln1/1000}A ac1_in_v_ln2={ac1_in_v_ln2/1000}v ac1_i_ln2={ac1_i_ln2/1000}A load_f={load_f} ac2_f={ac2_f} ac1_in_i={ac1_in_i/1000}A ac1_in_p={ac1_in_p:.0f}W p11={p11} p15={p15} pad28={pad28} pad29={pad29} pad30={pad30}')
@@ -136,11 +258,11 @@ class XanbusSniffer(object):
 
 
     # DC statistics (charging battery and PV input)
-    def processDcSrcSts2(self, src, bytes):
+    def processDcSrcSts2(self, src, bytes, decoder):
         device = self.all_xanbus_devices[src]
         
         #print(f'processDcSrcSts2: src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
-        (status,assoc,voltage,current,power) = struct.unpack('<BBIii13x', bytes)
+        (assoc,voltage,current,power) = decoder.unpack_from(bytes)
         #print(f'src={src} DC batt voltage={voltage/1000}v current={current/1000}A power={power}W')
 
         # DC output - what is going to the battery
@@ -173,13 +295,13 @@ class XanbusSniffer(object):
             #b'0315 c0d00500 56e1ffff a6010015 0315c0d00500d8040000d80100'
             #print(power)
 
-    def processSpsSts(self, src, bytes):
+    def processSpsSts(self, src, bytes, decoder):
         # b'0300ffffff7fffffff7f0d010001ffffffffffff' -- gen on
         #print(f'{processSpsSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         pass
 
     # See https://github.com/xela144/CANaconda/blob/master/metadata/Xanbus.xml  
-    def processChgSts(self, src, bytes):
+    def processChgSts(self, src, bytes, decoder):
         #print(f'{processChgSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         #b'0303 50 dc 00 00 50 40 01 00 03 01 0103 02 c100ffffff' - mppt
         #b'0303 50 dc 00 00 50 40 01 00 05 01 0103 02 c100ffffff' - mppt
@@ -191,33 +313,34 @@ class XanbusSniffer(object):
         # TODO: decode the rest! --> 03, 05, 02
         #       chg_en_sts doesn't exist for the XW+ so it's likely not that value we are decoding
         # chg_mode = 1 == primary, 2 == secondary
-        (status,assoc,pad1,pad2,pad3,pad4,pad5,pad6,pad7,pad8,pad9,chg_en_sts,chg_sts,chg_mode) = struct.unpack('<BBBBBBBBBBBBHB5x', bytes)
+        # (status,assoc,pad1,pad2,pad3,pad4,pad5,pad6,pad7,pad8,pad9,chg_en_sts,chg_sts,chg_mode) = '<BBBBBBBBBBBBHB5x'
+        (chg_en_sts,chg_sts,chg_mode) = decoder.unpack_from(bytes)
 
         # chg_mode == 769 -> bulk, 770 -> absorb, 773 -> float,  see modbus doc, 777=qualifying ac
         #print(f'src={src} chg_en_sts={chg_en_sts} chg_sts={chg_sts} chg_mode={chg_mode}')
 
-    def processInvSts2(self, src, bytes):
+    def processInvSts2(self, src, bytes, decoder):
         #print(f'{processInvSts2.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # b'03 33 0004 f1 15 00 fe'
         # b'03 43 0004 f1 15 10 fe'
         # b'03 33 0104 f1 15 00 fe' -- with gen on
         # b'03 43 0104 f1 15 10 fe' -- with gen on
-        (status,assoc,inverter_status,pad,inverter_configuration) = struct.unpack('<BBHBB2x', bytes)
+        (assoc,inverter_status,inverter_configuration) = decoder.unpack_from(bytes)
         #inverter_status: 1024 == Invert, 1025 == AC Pass Through, see modbus doc "Section 10: Inverter Status"
         #inverrer_configuration: 21 (0x15) == Split Phase Master see Section 18: Conext XW/XW+ Inverter Configuration
         #print(f'src={src} assoc={assoc:x} inverter_status={inverter_status} inverter_configuration={inverter_configuration}')
 
     # DONE!
-    def processDateTimeSts(self, src, bytes):
+    def processDateTimeSts(self, src, bytes, decoder):
         #print(f'{processDateTimeSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # b'03 da4d9267 d4fefd'
-        (status,d,offset) = struct.unpack('<BIhx', bytes)
+        (d,offset) = decoder.unpack_from(bytes)
         current_date = time.gmtime(d+(offset*60))
         self.all_xanbus_devices[src].values['CurrentDateTime'] = current_date
         #print(current_date)
 
 
-    def processAgsSts(self, src, bytes):
+    def processAgsSts(self, src, bytes, decoder):
         #print(f'{processAgsSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         #b'03 13 0b 01 0a              00           10 00 00 fc ffffff'
         #b'03 13 0b 01 0a              00           10 00 00 fc ffffff'
@@ -226,10 +349,10 @@ class XanbusSniffer(object):
         # TODO: decode gen_state? fault/warnings? 00/00
         # gen_action: 10 == stopped, 9 == runnning, see Section 4: Generator Actions
         # gen_on/off reasons: see Section 5: Generator On Reason/Section 6: Generator Off Reasons
-        (status,assoc,pad,pad,gen_action,on_reason,off_reason) = struct.unpack('<BBBBBBB6x', bytes)
+        (gen_action,on_reason,off_reason) = decoder.unpack_from(bytes)
         #print(f'src={src} gen_action={gen_action} on_reason={on_reason} off_reason={off_reason}')
 
-    def processUnknown2(self, src, bytes):
+    def processUnknown2(self, src, bytes, decoder):
         # We seem to sometimes get shorter and different responses
         #if len(bytes) != 118:
         #    return
@@ -241,19 +364,19 @@ class XanbusSniffer(object):
                 #print(f'new={binascii.hexlify(bytes)}')
                 self.unknown_bytes = bytes
                 #(state,op,pad1,pad2,pad3,pad4,pad5,pad6,pad7,pad8,pad9,pad10,pad11,pad12,dc_out_energy_day,pad13,pad14,pad15,pad16,pad17,pad18,pad19,pad20,dc_out_energy_month) = struct.unpack('<BBIIIIIIIIIIIIIIIIIIcccI37x', bytes)
-                (status,assoc,pad1,pad2,pad3,pad4,pad5,pad6,pad7,pad8,pad9,pad10,pad11,pad12,dc_out_energy_day,pad13,pad14,pad15,pad16,pad17,pad18,pad19,pad20,dc_out_energy_month) = struct.unpack('<BBIIIIIIIIIIIIIIIIIIcccI37x', bytes)
+                (dc_out_energy_day,dc_out_energy_month) = decoder.unpack_from(bytes)
                 #print(f'src={src} dc_out_energy_day={dc_out_energy_day} dc_out_energy_month={dc_out_energy_month}')
                 #print(f'pad5={hex(pad5)} pad6={pad6}')
 
-    def processUnknown3(self, src, bytes):
+    def processUnknown3(self, src, bytes, decoder):
         #print(f'{self.processUnknown3.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # b'49 01 20 01 01 00 00 00'
-        (pad1,) = struct.unpack('<B7x', bytes)
+        (pad1,) = decoder.unpack_from(bytes)
         #print(f'pad1={pad1:x}')
         #if pad1 == 0x49:
         #    print(f'{self.processUnknown3.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
 
-    def processProdInfoSts(self, src, bytes):
+    def processProdInfoSts(self, src, bytes, decoder):
         #print(f'{processProdInfoSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # b'07 58572041475300000000000000000000 3836352d313036302d303100 ffff ffffffffffffffffffffffffffffffffff' -- AGS
         # b'07 426174744d6f6e000000000000000000 3836352d313038302d303100 ffff ffffffffff7fffffffffffffffffffffff' -- BattMon
@@ -273,7 +396,7 @@ class XanbusSniffer(object):
         device = clazz(src)
         self.all_xanbus_devices[src] = device
 
-    def processHwRevSts(self, src, bytes):
+    def processHwRevSts(self, src, bytes, decoder):
         #print(f'{processHwRevSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # b'07 01 00 e0 01 00 42313331313733333000 d0a1dca9d0a1ffffffffff' -- BattMon
         # b'07 ff ff e0 ff ff 30303030313844373032443400 000000 ffffffffff' -- AGS
@@ -285,7 +408,7 @@ class XanbusSniffer(object):
         device = self.all_xanbus_devices[src]
         device.serial_number = serial_number
 
-    def processSwVerSts(self, src, bytes):
+    def processSwVerSts(self, src, bytes, decoder):
         #print(f'{processSwVerSts.__name__} src = {src} len = {len(bytes)} bytes={binascii.hexlify(bytes)}')
         # b'07 f0 02 dc 50 00 00 04 00 f0 00 a1 28 00 00 b403 f003 10 2700 0006 00 ff ff' -- XW+
         #  dc50 -> 50dc = 20700 -> 2.07.00, 04 - bn4
@@ -293,6 +416,45 @@ class XanbusSniffer(object):
         #  7427 -> 2774 -> 10100 -> 1.01.00, 64 - bn100
         pass
 
+    # Program the bus acceptance filters from our handlers. Discovery replies
+    # are only accepted while we are waiting for some.
+    def applyFilters(self, bus, discovering):
+        if not self.filtering or bus == None:
+            return
+
+        exclude = () if discovering else XanbusSniffer.DISCOVERY_PGNS
+        bus.set_filters(self.registry.canFilters(exclude))
+        self.discovering = discovering
+
+    # Number of frames received by the local CAN interface, filtered or not.
+    # Not available through socketcand.
+    def rxPackets(self):
+        if self.config['conext']['xanbus_sniffer'].get("host", None) != None:
+            return None
+
+        channel = self.config['conext']['xanbus_sniffer']['channel']
+        try:
+            with open(f"/sys/class/net/{channel}/statistics/rx_packets", "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def busStatistics(self, rx_packets_at_start):
+        accepted = self.receiver.received
+        rx_packets = self.rxPackets()
+        if rx_packets == None or rx_packets_at_start == None:
+            return f"CAN frames: {accepted} accepted"
+
+        received = rx_packets - rx_packets_at_start
+        rejected = max(0, received - accepted)
+        ratio = 100 * rejected / received if received > 0 else 0
+        return f"CAN frames: {received} received, {accepted} accepted, {rejected} rejected ({ratio:.0f}%)"
+
+    def latencyStatistics(self):
+        if self.latency_count == 0:
+            return "Latency: no message processed"
+        return f"Latency: {self.latency_total*1000/self.latency_count:.3f}ms average, {self.latency_max*1000:.3f}ms max"
+
     def processXanbusMessage(self, xanbus_message):
         pgn = xanbus_message.pgn
         src = xanbus_message.src
@@ -301,178 +463,66 @@ class XanbusSniffer(object):
         buffer = xanbus_message.bytes()
 
         # We check if we are still in discovery mode for the Xanbus device we
-        # just received a message for to process. If that's the case we discard
-        # what we received until our Xanbus device object is properly initialized
-        if self.all_xanbus_devices[src] == True and pgn != 0x1F014:
+        # just received a message for to process (or if we haven't even started
+        # discovering it). If that's the case we discard what we received until
+        # our Xanbus device object is properly initialized
+        device = self.all_xanbus_devices.get(src)
+        if (device == None or device == True) and pgn != 0x1F014:
             return
 
-        match pgn:
-            # ALL / Sts -- status?
-            case 0x1F00F:
-                return
-                #print(f'{pgn:x} {src} {binascii.hexlify(buffer)}')
-
-            # XW+ / AcStsRms
-            # Collides with standardized "PGN: 126998 - Configuration Information"
-            case 0x1F016:
-                #return
-                self.processAcStsRms(src, buffer)
-    
-            # XW+ / AcXferSwSts (useless?)
-            # 03 20 03 01 -- gen off
-            # 03 22 03 02 -- when gen is on
-            case 0x1F0BF:
-                return
-                print(f'{pgn} {src} {binascii.hexlify(buffer)}')
-
-            # XW+ / InvSts2  (inverter status?)
-            case 0x1F0BD:
-                #return
-                self.processInvSts2(src, buffer)
-
-            # XW+/MPPT / DcSrcSts2
-            case 0x1F0C5:
-                #return
-                self.processDcSrcSts2(src, buffer)
-
-            # XW+/MPPT / BattSts2
-            case 0x1F0C4:
-                #return
-                self.processBattSts2(src, buffer)
-
-            # XW+/MPPT / SpsSts
-            # Sps == {sensor,secondary} power supply? // Smart Production Solution?
-            # same data over and over?
-            case 0x1F0C6:
-                #return
-                self.processSpsSts(src, buffer)
-
-            # XW+/MPPT / ChgSts -- charger status
-            # First value is 56400 which looks like 56.4v
-            case 0x1F00E:
-                #return
-                self.processChgSts(src, buffer)
-
-            # BattMon / BattMonSts
-            case 0x1F01B:
-                #return
-                self.processBattMonSts(src, buffer)
-
-            # AGS / AgsSts
-            case 0x1F011:
-                #return
-                self.processAgsSts(src, buffer)
-
-            # SCP/XW+/InsightHome(src==6) / DateTimeSts
-            # Non-standard date-format
-            case 0x1F809:
-                #return
-                self.processDateTimeSts(src, buffer)
-
-            case 0x1F014:
-                self.processProdInfoSts(src, buffer)
-
-            case 0x1F810:
-                self.processHwRevSts(src, buffer)
-
-            case 0x1F80E:
-                self.processSwVerSts(src, buffer)
+        if not self.registry.dispatch(pgn, src, buffer):
+            print(f'unknown: {pgn} {src} {dst} {pri} {binascii.hexlify(buffer)}')
 
-        
-            #
-            # UNDOCUMENTED STUFF
-            #
-
-            # MPPT data - looks like data produced per hour/day/week...
-            # No data is being sent by the XW+ even the generator is on
-            case 0x1F0BE:
-                #return
-                self.processUnknown2(src, buffer)
-            
-            # coming only from MPPT?
-            # Single packet, weird sequence over and over
-            # 2nd by changes, but 3rd and 4th are relatively static
-            case 0x1F00D:
-                return
-                print(f'{pgn} {src} {dst} {binascii.hexlify(buffer)}')
 
-            # coming from XW only?
-            # weird sequence, over and over
-            # no data received when gen is on?!?
-            case 0x1F01D:
-                return
-                print(f'{pgn} {src} {dst} {binascii.hexlify(buffer)}')
+    def sniff(self):
+        if self.publisher == None:
+            self.publisher = MqttPublisher(self.config)
+            self.publisher.start()
+        bus = None
+        trace = None
+        rx_packets_at_start = None
+        if self.config['conext']['xanbus_sniffer'].get("replay", None) != None:
+            # Frames come from a recording and nothing is sent, our discovery
+            # requests' replies being part of it
+            self.receiver = XanbusReplay(self.config['conext']['xanbus_sniffer']['replay'],
+                                         self.config['conext']['xanbus_sniffer'].get("replay_realtime", False))
+        else:
+            # Frames are received by our receiver's thread while we send discovery
+            # requests and reprogram filters, so the bus must be thread safe
+            if self.config['conext']['xanbus_sniffer'].get("host", None) != None:
+                bus = can.ThreadSafeBus(interface='socketcand',
+                                      host=self.config['conext']['xanbus_sniffer']['host'],
+                                      port=self.config['conext']['xanbus_sniffer']['port'],
+                                      channel=self.config['conext']['xanbus_sniffer']['channel'])
+            else:
+                bus = can.ThreadSafeBus(interface='socketcan',
+                                        channel=self.config['conext']['xanbus_sniffer']['channel'])
 
-            # coming from MPPT? - looks like we get 0301 all the time
-            # maybe just status info
-            case 0x1F0C9:
-                return
-                print(f'{pgn} {src} {dst} {binascii.hexlify(buffer)}')
+            if self.config['conext']['xanbus_sniffer'].get("record", None) != None:
+                trace = XanbusTrace(self.config['conext']['xanbus_sniffer']['record'])
 
-            # src == 0 - that's the SCP
-            # We get 030105 all the time, also maybe just status info
-            case 0x1F01C:
-                return
-                print(f'{pgn} {src} {dst} {binascii.hexlify(buffer)}')
-
-            # Sent by XW6848 Pro only
-            case 0x1DC00:
-                #return
-                self.processUnknown3(src, buffer)
-
-            # unknown: 75008 1 0 Timestamp: 1737842977.896904    ID: 19250001    X Rx                DL:  4    10 00 83 03                 Channel: can0
-            # unknown: 75008 1 0 Timestamp: 1737842977.906757    ID: 19250001    X Rx                DL:  4    10 00 85 13                 Channel: can0
-            # unknown: 75008 1 0 Timestamp: 1737842977.916757    ID: 19250001    X Rx                DL:  4    10 00 86 33                 Channel: can0
-            # unknown: 75008 1 0 Timestamp: 1737842977.926593    ID: 19250001    X Rx                DL:  4    10 00 87 43                 Channel: can0
-            # AssocCfg
-            case 0x12500:
-                return
-                print(f'{pgn} {src} {dst} {pri} {binascii.hexlify(buffer)}')
-            #
-            # Standard stuff
-            #
-            # STD: ISO Acknowledgement
-            # 59392
-            case 0xE800:
-                return
-                print(f'ISO Ack: {pgn} {src} {dst} {binascii.hexlify(buffer)}')
-                
-            # STD: ISO Request
-            # 59904 0 3 Timestamp: 1737842084.946513    ID: 18ea0300    X Rx                DL:  3    be f0 01                    Channel: can0
-            # See https://www.csselectronics.com/pages/j1939-explained-simple-intro-tutorial#j1939-request-messages for an excellent documentation
-            case 0xEA00:
-                return
-                print(f'ISO Request: {pgn} {src} {dst} {binascii.hexlify(buffer)}')
-        
-            # STD: ISO Address Claim
-            case 0xEE00:
-                return
-                print(f'ISO Address Claim: {pgn} {src} {dst} {pri} {binascii.hexlify(buffer)}')
-                
-            case _:
-                #continue
-                print(f'unknown: {pgn} {src} {dst} {pri} {binascii.hexlify(buffer)}')
-                return
+            # Everything needs to be discovered when we start
+            self.applyFilters(bus, True)
+            rx_packets_at_start = self.rxPackets()
 
+            # Frames are read by the receiver's thread, we reassemble, decode and
+            # publish them from ours
+            self.receiver = XanbusReceiver.fromConfig(bus, self.config['conext']['xanbus_sniffer'], trace)
 
-    def sniff(self):
-        paho_client = paho.Client()
-        if self.config['conext']['xanbus_sniffer'].get("host", None) != None:
-            bus = can.interface.Bus(interface='socketcand',
-                                    host=self.config['conext']['xanbus_sniffer']['host'],
-                                    port=self.config['conext']['xanbus_sniffer']['port'],
-                                    channel=self.config['conext']['xanbus_sniffer']['channel'])
-        else:
-            bus = can.ThreadSafeBus(interface='socketcan',
-                                    channel=self.config['conext']['xanbus_sniffer']['channel'])
+        self.discovery_deadline = time.monotonic() + XanbusSniffer.DISCOVERY_WINDOW
+        self.receiver.start()
 
         #HAS_SENT_MESSAGE = True
         last_update = int(time.time())
         need_to_update = True
 
         while True:
-            if self.must_stop:
-                bus.shutdown()
+            if self.must_stop or self.receiver.done:
+                self.receiver.stop()
+                if bus != None:
+                    bus.shutdown()
+                if trace != None:
+                    trace.close()
                 return
 
             ## TEST
@@ -497,58 +547,65 @@ class XanbusSniffer(object):
             #     HAS_SENT_MESSAGE = True
             ## TEST
 
-            message = bus.recv(1)
-            (pgn, src, dst, pri) = Iso11783Decode(message.arbitration_id)
-
-            xanbus_message = self.xanbus_queue.get(message.arbitration_id, None)
-            if xanbus_message == None:
-                xanbus_message = XanbusMessage(pgn,src,dst,pri)
-                self.xanbus_queue[message.arbitration_id] = xanbus_message
-            
-            xanbus_message.append_bytes(message)
-            processed_keys = []
+            frame = self.receiver.get(1)
+            now = time.monotonic()
+            self.reassembler.expire(now)
+            if self.discovering and now >= self.discovery_deadline:
+                self.applyFilters(bus, False)
+            if frame == None:
+                continue
+            (timestamp, arbitration_id, data) = frame
+
+            xanbus_id = self.ids.decode(arbitration_id)
+            src = xanbus_id.src
+
+            # Only the message this frame belongs to can be done (or broken).
+            # Frames of ignored PGNs aren't even reassembled.
+            ready_message = None
+            if not xanbus_id.is_ignored:
+                ready_message = self.reassembler.append(arbitration_id, data, xanbus_id.pgn, src, xanbus_id.dst, xanbus_id.pri, now, xanbus_id.is_fast_packet)
+            if ready_message != None:
+                try:
+                    self.processXanbusMessage(ready_message)
+                except:
+                    print("Exception occured while processing Xanbus message, ingoring.")
+
+                latency = time.time() - timestamp
+                self.latency_count += 1
+                self.latency_total += latency
+                if latency > self.latency_max:
+                    self.latency_max = latency
 
             # If it's the first time we see the device, we send a ProdInfoSts message
             # on the Xanbus to discover what it is about
             if self.all_xanbus_devices.get(src) == None:
-                aid = Iso11783Encode(59904, src, src, 6)
-                msg = can.Message(
-                    arbitration_id=aid,
-                    data=[0x14, 0xF0, 0x1], # OK - ProdInfoSts // Device Name/FGA
-                    is_extended_id=True
-                )
-                bus.send(msg)
-
-                aid = Iso11783Encode(59904, src, src, 6)
-                msg = can.Message(
-                    arbitration_id=aid,
-                    data=[0x10, 0xF8, 0x1], # OK - HwRevSts
-                    is_extended_id=True
-                )
-                bus.send(msg)
+                # Replies must get through before we ask
+                if not self.discovering:
+                    self.applyFilters(bus, True)
+                self.discovery_deadline = now + XanbusSniffer.DISCOVERY_WINDOW
+
+                if bus != None:
+                    aid = Iso11783Encode(59904, src, src, 6)
+                    msg = can.Message(
+                        arbitration_id=aid,
+                        data=[0x14, 0xF0, 0x1], # OK - ProdInfoSts // Device Name/FGA
+                        is_extended_id=True
+                    )
+                    bus.send(msg)
+
+                    aid = Iso11783Encode(59904, src, src, 6)
+                    msg = can.Message(
+                        arbitration_id=aid,
+                        data=[0x10, 0xF8, 0x1], # OK - HwRevSts
+                        is_extended_id=True
+                    )
+                    bus.send(msg)
 
                 # We add a temporary value in our hash in order to avoid sending multiple
                 # discovery messsages for the same src device
                 self.all_xanbus_devices[src] = True
                 continue
 
-            for key in self.xanbus_queue.keys():
-                xm = self.xanbus_queue.get(key)
-
-                if xm.is_bogus:
-                    processed_keys.append(key)
-                    continue
-
-                if xm.is_ready:
-                    try:
-                        self.processXanbusMessage(xm)
-                    except:
-                        print("Exception occured while processing Xanbus message, ingoring.")
-                    processed_keys.append(key)
-
-            for key in processed_keys:
-                del self.xanbus_queue[key]
-
             # We publish and display our information every five seconds or so
             current_time = int(time.time())
             if current_time != last_update and (current_time-last_update) % 5 == 0:
@@ -556,8 +613,6 @@ class XanbusSniffer(object):
                 last_update = current_time
 
             if need_to_update:
-                paho_client.connect(self.config['mqtt']['host'], int(self.config['mqtt']['port']), 60)
-
                 all_devices = {}
                 for key in sorted(self.all_xanbus_devices.keys()):
                     device = self.all_xanbus_devices[key]
@@ -566,21 +621,65 @@ class XanbusSniffer(object):
                         self.logger.info(device.formattedOutput())
                         self.logger.info("")
             
-                paho_client.publish("berrybms", json.dumps(all_devices))
-                paho_client.disconnect()
+                self.publisher.publishDevices(all_devices)
                 need_to_update = False
+                (completed, dropped, timed_out) = self.reassembler.totals()
+                (decoded, seconds) = self.registry.totals()
+                self.logger.info(f"Xanbus messages: {completed} received, {dropped} dropped, {timed_out} timed out, {decoded} decoded in {seconds*1000:.1f}ms")
+                self.logger.info(self.busStatistics(rx_packets_at_start))
+                self.logger.info(self.receiver.statistics())
+                self.logger.info(self.latencyStatistics())
+                for line in self.registry.report():
+                    self.logger.debug(line)
                 self.logger.info("Will update things in about 5 seconds...")
 
     def stop(self):
         self.must_stop = True
 
-# When running from the command line
+# When running from the command line:
+#
+#   XanbusSniffer.py                           sniff the Xanbus
+#   XanbusSniffer.py --record <file>           sniff and record the frames received
+#   XanbusSniffer.py --replay <file>           replay a recording, as fast as possible
+#   XanbusSniffer.py --replay <file> --realtime
+#   XanbusSniffer.py --benchmark <file>        replay a recording and report throughput
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Xanbus sniffer")
+    parser.add_argument("--record", metavar="FILE", help="record the frames received to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="replay the frames recorded in FILE")
+    parser.add_argument("--realtime", action="store_true", help="replay frames at the pace they were recorded")
+    parser.add_argument("--benchmark", metavar="FILE", help="replay FILE as fast as possible and report throughput")
+    args = parser.parse_args()
+
     f = open("config.yaml","r")
     config = yaml.load(f, Loader=yaml.SafeLoader)
 
-    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
+    if args.record != None:
+        config['conext']['xanbus_sniffer']['record'] = args.record
+    if args.replay != None or args.benchmark != None:
+        config['conext']['xanbus_sniffer']['replay'] = args.replay if args.benchmark == None else args.benchmark
+        config['conext']['xanbus_sniffer']['replay_realtime'] = args.realtime and args.benchmark == None
+
+    # The periodic output would get in the way of the benchmark's results
+    level = logging.WARNING if args.benchmark != None else logging.INFO
+    logging.basicConfig(stream=sys.stdout, level=level, format='%(message)s')
     logger = logging.getLogger(__name__)
 
     xanbus_sniffer = XanbusSniffer(config, logger)
-    xanbus_sniffer.sniff()
\ No newline at end of file
+    start = time.perf_counter()
+    xanbus_sniffer.sniff()
+    elapsed = time.perf_counter() - start
+
+    if args.benchmark != None:
+        frames = xanbus_sniffer.receiver.received
+        (completed, dropped, timed_out) = xanbus_sniffer.reassembler.totals()
+        (decoded, seconds) = xanbus_sniffer.registry.totals()
+        print(f"{frames} frames in {elapsed:.3f}s, {frames/elapsed:.0f} frames/s")
+        print(f"Xanbus messages: {completed} received, {dropped} dropped, {timed_out} timed out, {decoded} decoded in {seconds*1000:.1f}ms")
+        print(xanbus_sniffer.latencyStatistics())
+        for line in xanbus_sniffer.registry.report():
+            print(line)
+
+    xanbus_sniffer.publisher.stop()
\ No newline at end of file
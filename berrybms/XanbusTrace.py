@@ -0,0 +1,104 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import os
+import struct
+import time
+
+import can # type: ignore
+
+# Recording of the CAN frames received from the Xanbus, to replay them later
+# on (see XanbusReplay). Frames are appended to the file as they arrive, so
+# recording can be stopped and resumed at will.
+#
+# Our own format starts with MAGIC, followed by one record per frame: its
+# timestamp (double, seconds since the epoch), arbitration id (uint32), data
+# length (uint8) and data. Files ending with .asc, .blf or .log are written
+# (and read) by python-can instead, in the format their extension implies.
+# python-can can only append to .log files, so we refuse to record to an
+# existing .asc or .blf file rather than overwrite it.
+class XanbusTrace(object):
+
+    MAGIC = b"XANBUS\x00\x01"
+    RECORD = struct.Struct('<dIB')
+
+    # python-can log formats, the ones it can append to first
+    CAN_FORMATS = ('.log', '.asc', '.blf')
+    CAN_APPENDABLE_FORMATS = ('.log',)
+
+    # Seconds between two flushes of what's recorded to the file
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self,
+                 path):
+        self.path = path
+        self.file = None
+        self.can_logger = None
+        self.written = 0
+        self.flushed_at = time.monotonic()
+
+        if path.endswith(XanbusTrace.CAN_APPENDABLE_FORMATS):
+            self.can_logger = can.Logger(path, append=True)
+        elif path.endswith(XanbusTrace.CAN_FORMATS):
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                raise ValueError(f"Can't append to {path}, python-can can only append to .log files")
+            self.can_logger = can.Logger(path)
+        else:
+            self.file = open(path, "ab")
+            if self.file.tell() == 0:
+                self.file.write(XanbusTrace.MAGIC)
+
+    # Record a python-can message
+    def write(self, message):
+        self.written += 1
+        if self.can_logger != None:
+            self.can_logger(message)
+            return
+
+        data = message.data
+        self.file.write(XanbusTrace.RECORD.pack(message.timestamp, message.arbitration_id, len(data)))
+        self.file.write(data)
+
+        now = time.monotonic()
+        if now - self.flushed_at >= XanbusTrace.FLUSH_INTERVAL:
+            self.file.flush()
+            self.flushed_at = now
+
+    def close(self):
+        if self.can_logger != None:
+            self.can_logger.stop()
+            self.can_logger = None
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+    # Frames of a recording, as (timestamp, arbitration id, data) tuples. A
+    # record cut short (ie, when we were killed while recording) ends it.
+    @staticmethod
+    def read(path):
+        if path.endswith(XanbusTrace.CAN_FORMATS):
+            for message in can.LogReader(path):
+                yield (message.timestamp, message.arbitration_id, message.data)
+            return
+
+        record = XanbusTrace.RECORD
+        with open(path, "rb") as f:
+            if f.read(len(XanbusTrace.MAGIC)) != XanbusTrace.MAGIC:
+                raise ValueError(f"{path} isn't a Xanbus trace")
+
+            while True:
+                header = f.read(record.size)
+                if len(header) < record.size:
+                    return
+                (timestamp, arbitration_id, length) = record.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                yield (timestamp, arbitration_id, data)
@@ -13,22 +13,18 @@ import sys
 import time
 import yaml # type: ignore
 import logging
-import json
 import signal
 import threading
 
-import paho.mqtt.client as paho # type: ignore
-
 from ConextAGS import ConextAGS
-from ConextInsightHome import ConextInsightHome
-from JKBMS import JKBMS
+from DeviceSession import DeviceSession
 from JKBMSSniffer import JKBMSSniffer
+from ModbusReadPlanner import ModbusReadPlanner
 from Register import Register
 from XanbusSniffer import XanbusSniffer
 
 # Global variables to enable cleanups in signal handler
-all_modbus_devices = []
-paho_client = None
+session = None
 jkbms_sniffer = None
 jkbms_sniffer_thread = None
 xanbus_sniffer = None
@@ -36,12 +32,6 @@ xanbus_sniffer_thread = None
 
 def cleanup(_signo, _stack_frame):
     print("Cleaning up before being terminated!")
-    if paho_client != None:
-        paho_client.disconnect()
-
-    for device in all_modbus_devices:
-        device.disconnect()
-
     if jkbms_sniffer != None:
         jkbms_sniffer.stop()
         jkbms_sniffer_thread.join()
@@ -52,6 +42,10 @@ def cleanup(_signo, _stack_frame):
         xanbus_sniffer_thread.join()
         print("Xanbus sniffer thread stopped.")
 
+    # The sniffers share our MQTT publisher, so we close it last
+    if session != None:
+        session.close()
+
     sys.exit(0)
 
 def main(daemon):
@@ -62,22 +56,21 @@ def main(daemon):
     # Load the YAML configuration file
     f = open("config.yaml","r")
     config = yaml.load(f, Loader=yaml.SafeLoader)
+    ModbusReadPlanner.configure(config.get('modbus', None))
+    Register.configure(config.get('refresh', None))
 
     # We removing logging for subthreads
     logging.basicConfig(handlers=[])
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
 
+    # Connections to the MQTT broker and to all devices are kept open, and
+    # devices reused, from one update to the next
+    global session, jkbms_sniffer, jkbms_sniffer_thread, xanbus_sniffer, xanbus_sniffer_thread
+    session = DeviceSession(config)
+
     while True:
-        # Connect to the MQTT server. We do it each time since it's not costly
-        # and avoids long keepalive if the updateinterval is set to a high value.
-        global paho_client, jkbms_sniffer, jkbms_sniffer_thread, xanbus_sniffer, xanbus_sniffer_thread, all_modbus_devices
-        paho_client = paho.Client()
-        try:
-            paho_client.connect(config['mqtt']['host'], int(config['mqtt']['port']), 60)
-        except:
-            print("Couldn't connect to the MQTT broker, the GUI part if used, won't be updated.")
-            paho_client = None
+        publisher = session.mqtt()
 
         all_devices = {}
         all_bms = config.get('bms', dict())
@@ -92,33 +85,27 @@ def main(daemon):
         lowest_soc = 100
         lowest_id = 0
 
+        polled_bms = dict()
         for key in all_bms.keys():
-            bms = all_bms[key]
-            bms_port = bms['port']
-
             if key == "jk_sniffer":
                 if jkbms_sniffer == None:
-                    jkbms_sniffer = JKBMSSniffer(config, logger)
+                    jkbms_sniffer = JKBMSSniffer(config, logger, publisher)
                     jkbms_sniffer_thread = threading.Thread(target=jkbms_sniffer.sniff, daemon=False)
                     jkbms_sniffer_thread.start()
                     print("Started JKBMS sniffer thread!")
                 continue
 
-            bms_id = bms['id']
+            polled_bms[key] = all_bms[key]
 
-            jkbms = JKBMS(key, bms_id, bms_port)
-            c = jkbms.connect()
-
-            if c == None:
-                continue
+        for (jkbms, output) in session.pollAllBMS(polled_bms, config.get('polling', dict())):
+            bms_id = jkbms.id
 
             #print(jkbms)
-            print(jkbms.formattedOutput(),'\n')
+            print(output,'\n')
 
-            all_modbus_devices.append(jkbms)
             active_bms += 1
 
-            soc = jkbms.getRegister('SOCStateOfcharge').value & 0x0FF
+            soc = jkbms.values.get('SOCStateOfcharge', 0) & 0x0FF
             average_soc += soc;
 
             # We adjust the lowest/highest SOC
@@ -129,8 +116,8 @@ def main(daemon):
                 lowest_soc = soc
                 lowest_id = bms_id
 
-            average_voltage += jkbms.getRegister('BatVol').value
-            total_used_capacity += (jkbms.getRegister('SOCFullChargeCap').value - jkbms.getRegister('SOCCapRemain').value)
+            average_voltage += jkbms.values.get('BatVol', 0)
+            total_used_capacity += (jkbms.values.get('SOCFullChargeCap', 0) - jkbms.values.get('SOCCapRemain', 0))
 
             # Publish all BMS values in MQTT
             jkbms.publish(all_devices)
@@ -139,19 +126,18 @@ def main(daemon):
         # InsightHome as it'll update properly populated data structures from there
         if config['conext'].get('xanbus_sniffer', None) != None:
             if xanbus_sniffer == None:
-                xanbus_sniffer = XanbusSniffer(config, logger)
+                xanbus_sniffer = XanbusSniffer(config, logger, publisher)
                 xanbus_sniffer_thread = threading.Thread(target=xanbus_sniffer.sniff, daemon=False)
                 xanbus_sniffer_thread.start()
                 print("Started Xanbus sniffer thread!")
 
+        conext = None
         if config['conext']['insighthome'] != None:
-            conext = ConextInsightHome(config['conext']['insighthome']['host'],
-                                       config['conext']['insighthome']['port'],
-                                       config['conext']['insighthome'].get('ids', None),
-                                       config['conext'].get('serial_number_hack', None))
-            all_modbus_devices.append(conext)
-            c = conext.connect()
+            conext = session.insightHome()
+
+        if conext != None:
             devices = conext.allDevices()
+            conext.pollAll()
             for device in devices:
                 device.publish(all_devices)
                 #print("%s: %s\n" % (type(device).__name__, device))
@@ -159,14 +145,7 @@ def main(daemon):
                 print(device.formattedOutput(),'\n')
 
         # Publish all values in MQTT
-        if paho_client != None:
-            paho_client.publish("berrybms", json.dumps(all_devices))
-            paho_client.disconnect()
-
-        # We disconnect from all Modbus devices
-        for device in all_modbus_devices:
-            device.disconnect()
-        all_modbus_devices = []
+        publisher.publishDevices(all_devices)
 
         if active_bms > 0:
             print("== Global BMS Statistics ==")
@@ -187,6 +166,8 @@ def main(daemon):
         else:
             break
 
+    session.close()
+
 if __name__ == "__main__":
     args = sys.argv[1:]
     daemon = False
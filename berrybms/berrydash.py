@@ -18,9 +18,10 @@ import plotly.graph_objects as go # type: ignore
 import time
 import sys
 from flask_mqtt import Mqtt # type: ignore
-import json
 import yaml # type: ignore
 
+from PayloadCodec import PayloadCodec
+
 
 # Load the YAML configuration file
 f = open("config.yaml","r")
@@ -44,12 +45,24 @@ all_xw = {}
 @mqtt.on_connect()
 def handle_connect(client, userdata, flags, reason_code):
     print("Connected with result code "+ str(reason_code))
-    mqtt.subscribe("berrybms")
+    # With per device topics, we only subscribe to the devices' documents and
+    # not to their individual values
+    if config['mqtt'].get('topics', dict()).get('layout', "single") == "devices":
+        for type in ["battmon", "bms", "mppt", "xw"]:
+            mqtt.subscribe(f"berrybms/{type}/+")
+    else:
+        mqtt.subscribe("berrybms")
 
 @mqtt.on_message()
 def handle_mqtt_message(client, userdata, message):
-     devices = json.loads(message.payload)
+     devices = PayloadCodec.decode(message.payload)
      #print("Got values (%s) from MQTT from topic: %s" % (str(devices), message.topic))
+
+     # berrybms/<type>/<id> topics carry the values of a single device
+     if message.topic != "berrybms":
+        (prefix, type, id) = message.topic.split("/")
+        devices = {f"{type}-{id}": devices}
+
      for key in devices.keys():
         if key.startswith("battmon"):
             global all_battmon
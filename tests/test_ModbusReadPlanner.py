@@ -0,0 +1,84 @@
+#
+# Copyright (C) 2025 Extrafu <extrafu@gmail.com>
+#
+# This file is part of BerryBMS.
+#
+# BerryBMS is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any
+# later version.
+#
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "berrybms"))
+
+from pymodbus.client.mixin import ModbusClientMixin # type: ignore
+from pymodbus.pdu.register_message import ReadHoldingRegistersResponse # type: ignore
+
+from JKBMS import JKBMS
+
+# Device answering reads from a register map. The register at an address is
+# the address itself, so that we can tell where each decoded value comes from.
+# JK BMS addresses are byte offsets, a read of n registers spanning 2n of them.
+class FakeJKBMS(ModbusClientMixin):
+
+    def __init__(self):
+        self.reads = []
+
+    def read_holding_registers(self, address, count=1, slave=1, **kwargs):
+        self.reads.append((address, count))
+        return ReadHoldingRegistersResponse(registers=[(address + 2*i) & 0xFFFF for i in range(count)])
+
+class TestModbusReadPlanner(unittest.TestCase):
+
+    def bms(self):
+        bms = JKBMS("test", 1)
+        bms.connection = FakeJKBMS()
+        bms.setRegisters(JKBMS.REGISTERS)
+        return bms
+
+    def offsets(self, bms):
+        offsets = {}
+        for (address, count, members) in bms.planner.plan(JKBMS.REGISTERS):
+            for register in members:
+                offsets[register.name] = (address, (register.address - address) // bms.planner.scale, count)
+        return offsets
+
+    def test_jk_offsets(self):
+        offsets = self.offsets(self.bms())
+
+        self.assertEqual(offsets["CellCount"], (0x106C, 0, 6))
+        self.assertEqual(offsets["BatChargeEN"], (0x106C, 2, 6))
+        self.assertEqual(offsets["BatDisChargeEN"], (0x106C, 4, 6))
+
+        self.assertEqual(offsets["BatCurrent"][:2], (0x1298, 0))
+        self.assertEqual(offsets["Alarms"][:2], (0x1298, 4))
+        self.assertEqual(offsets["SOCStateOfcharge"][:2], (0x1298, 7))
+        self.assertEqual(offsets["SOCCycleCount"][:2], (0x1298, 12))
+
+        self.assertEqual(offsets["ManufacturerDeviceID"], (0x1400, 0, 16))
+        self.assertEqual(offsets["HardwareVersion"], (0x1400, 8, 16))
+        self.assertEqual(offsets["SoftwareVersion"], (0x1400, 12, 16))
+
+    # Values read in blocks must be the ones read one register at a time
+    def test_jk_block_reads(self):
+        block = self.bms()
+        block.planner.read(block, JKBMS.REGISTERS)
+        self.assertLess(len(block.connection.reads), len(JKBMS.REGISTERS))
+
+        single = self.bms()
+        for register in JKBMS.REGISTERS:
+            register.getValue(single, True)
+
+        for register in JKBMS.REGISTERS:
+            self.assertEqual(block.values[register.name], single.values[register.name], register.name)
+
+        # No window reads past the last register it holds
+        for (address, count) in block.connection.reads:
+            last = max(r.address + 2*r.length for r in JKBMS.REGISTERS if address <= r.address < address + 2*count)
+            self.assertEqual(address + 2*count, last)
+
+if __name__ == "__main__":
+    unittest.main()